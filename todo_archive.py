@@ -0,0 +1,292 @@
+#! /usr/bin/python
+
+################################################################################
+#
+# Name:
+#	todo_archive.py
+#
+# Description:
+#	This file contains the functions that look after the archive of
+#	completed tasks. When the list is cleaned up completed tasks are moved
+#	into a partition for the month they were completed in.
+#	  ~/tasks/archive/
+#	    |-manifest	    -	What partitions exist, the time range they
+#	    |			cover and how many tasks they hold.
+#	    |-2012/
+#	        |-Aug	    -	Tasks for the month that haven't been sealed.
+#	        |-Aug.0.gz  -	Sealed (read only) tasks for the month.
+#	Once a month has ended its partition is sealed. Should a task for a
+#	sealed month turn up later it starts a new segment for that month which
+#	is sealed in turn.
+################################################################################
+from todo_util import *
+from todo_fin import *
+import json
+import gzip
+import time
+
+# Compress partitions when they are sealed.
+ARCHIVE_COMPRESS = True
+
+###################################
+# Purpose:
+#	Get the directory the archive is kept in.
+# Inputs:
+#	N/A
+# Outputs:
+#	The path to the archive directory
+###################################
+def archive_path():
+    return os.getenv("HOME")+"/tasks/archive"
+
+###################################
+# Purpose:
+#	Work out which partition a task completed at a given time belongs to.
+# Inputs:
+#	comp	    -	The time the task was completed in seconds since the
+#			epoch.
+# Outputs:
+#	The name of the partition, "<year>/<month>" e.g. "2012/Aug"
+###################################
+def partition_name(comp):
+    day = time.localtime(comp)
+    return str(day[0])+"/"+number_to_month(day[1])
+
+###################################
+# Purpose:
+#	Load the manifest that describes the partitions in the archive.
+# Inputs:
+#	path	    -	The archive directory
+# Outputs:
+#	manifest    -	Dictionary of partition name to
+#			{"start":<number>, "end":<number>, "count":<number>,
+#			 "segments":[<sealed file names>], "open":<boolean>}
+###################################
+def load_manifest(path):
+    try:
+        file_handle = open(path+"/manifest", "r")
+        try:
+            return json.load(file_handle)
+        finally:
+            file_handle.close()
+    except IOError:
+        return {}
+
+###################################
+# Purpose:
+#	Write the manifest for the archive, it is written to a temporary file
+#	and moved into place so it is never left half written.
+# Inputs:
+#	path	    -	The archive directory
+#	manifest    -	The manifest to write
+# Outputs:
+#	N/A
+###################################
+def save_manifest(path, manifest):
+    temp_name = path+"/manifest."+str(os.getpid())
+    file_handle = open(temp_name, "w")
+    try:
+        json.dump(manifest, file_handle, indent=1, sort_keys=True)
+    finally:
+        file_handle.close()
+    os.rename(temp_name, path+"/manifest")
+
+###################################
+# Purpose:
+#	Append completed tasks to the partitions for the months they were
+#	completed in and update the manifest to match.
+# Inputs:
+#	tasks	    -	The list of completed tasks taken from priority level
+#			zero of the todo dictionary.
+# Outputs:
+#	N/A
+###################################
+def archive_tasks(tasks):
+    path = archive_path()
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    # The partitions and the manifest are changed together under one lock.
+    acquire_lock(path+"/manifest")
+    try:
+        append_partitions(path, tasks)
+    finally:
+        release_lock(path+"/manifest")
+
+###################################
+# Purpose:
+#	Append the tasks to their partitions, seal any finished months and save
+#	the manifest. The lock on the manifest must be held.
+# Inputs:
+#	path	    -	The archive directory
+#	tasks	    -	The list of completed tasks
+# Outputs:
+#	N/A
+###################################
+def append_partitions(path, tasks):
+    manifest = load_manifest(path)
+    # Group the tasks by the partition they belong to.
+    partitions = {}
+    for an_entry in tasks:
+        comp = an_entry.completed
+        if None == comp:
+            comp = time.time()
+        name = partition_name(comp)
+        if name not in partitions:
+            partitions[name] = []
+        partitions[name].append(an_entry)
+    for name in partitions:
+        part_tasks = partitions[name]
+        directory = path+"/"+name.split("/")[0]
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        write_tasks(generate_cleanup_lines(part_tasks), path+"/"+name, "a")
+        times = [an_entry.completed or time.time() for an_entry in part_tasks]
+        if name in manifest:
+            part = manifest[name]
+            part["start"] = min(part["start"], min(times))
+            part["end"] = max(part["end"], max(times))
+            part["count"] += len(times)
+            part["open"] = True
+        else:
+            manifest[name] = {"start": min(times), "end": max(times),\
+                "count": len(times), "segments": [], "open": True}
+    seal_partitions(path, manifest)
+    save_manifest(path, manifest)
+
+###################################
+# Purpose:
+#	Seal the open partitions for any month that has ended. The open file is
+#	turned into a new read only (and optionally compressed) segment.
+# Inputs:
+#	path	    -	The archive directory
+#	manifest    -	The manifest, updated in place.
+# Outputs:
+#	N/A
+###################################
+def seal_partitions(path, manifest):
+    current = partition_name(time.time())
+    for name in manifest:
+        part = manifest[name]
+        if not part["open"] or name == current:
+            continue
+        open_name = path+"/"+name
+        segment = name.split("/")[1]+"."+str(len(part["segments"]))
+        if ARCHIVE_COMPRESS:
+            segment += ".gz"
+        segment_name = path+"/"+name.split("/")[0]+"/"+segment
+        in_handle = open(open_name, "rb")
+        try:
+            if ARCHIVE_COMPRESS:
+                out_handle = gzip.open(segment_name, "wb")
+            else:
+                out_handle = open(segment_name, "wb")
+            try:
+                out_handle.write(in_handle.read())
+            finally:
+                out_handle.close()
+        finally:
+            in_handle.close()
+        os.chmod(segment_name, 0444)
+        os.remove(open_name)
+        part["segments"].append(segment)
+        part["open"] = False
+
+###################################
+# Purpose:
+#	Read the contents of every file that makes up a partition.
+# Inputs:
+#	path	    -	The archive directory
+#	name	    -	The name of the partition
+#	part	    -	The manifest entry for the partition
+# Outputs:
+#	contents    -	The lines of the partition
+###################################
+def read_partition(path, name, part):
+    year = path+"/"+name.split("/")[0]+"/"
+    raw = []
+    for segment in part["segments"]:
+        if segment.endswith(".gz"):
+            file_handle = gzip.open(year+segment, "rb")
+        else:
+            file_handle = open(year+segment, "rb")
+        try:
+            raw.append(file_handle.read())
+        finally:
+            file_handle.close()
+    if part["open"]:
+        file_handle = open(path+"/"+name, "rb")
+        try:
+            raw.append(file_handle.read())
+        finally:
+            file_handle.close()
+    return "".join(raw).decode("utf-8").splitlines(True)
+
+###################################
+# Purpose:
+#	Add the tasks of one completed dictionary into another.
+# Inputs:
+#	dictionary  -	The completed dictionary to add to
+#	extra	    -	The completed dictionary to take the tasks from
+# Outputs:
+#	dictionary  -	The combined completed dictionary
+###################################
+def merge_done(dictionary, extra):
+    for comp in extra:
+        if comp in dictionary:
+            dictionary[comp] += extra[comp]
+        else:
+            dictionary[comp] = extra[comp]
+    return dictionary
+
+###################################
+# Purpose:
+#	Load all the completed tasks since a given time, from the done file and
+#	from the archive. Only the archive partitions that cover the time
+#	asked for are opened.
+# Inputs:
+#	file_name   -	The name of the done file
+#	since	    -	Time in seconds since the epoch, tasks completed before
+#			this are not loaded.
+# Outputs:
+#	dictionary  -	The completed dictionary holding the tasks found
+###################################
+def load_history(file_name, since):
+    dictionary = load_done_window(file_name, since)
+    path = archive_path()
+    manifest = load_manifest(path)
+    for name in manifest:
+        part = manifest[name]
+        if part["end"] < since:
+            continue
+        tasks = parse_done_lines(read_partition(path, name, part))
+        for comp in tasks.keys():
+            if comp < since:
+                del tasks[comp]
+        merge_done(dictionary, tasks)
+    return dictionary
+
+###################################
+# Purpose:
+#       This function is used to clean up the todo dictionary, removing the
+#       completed tasks. At the same time the completed tasks are moved to
+#       the archive so they can be reviewed in the future.
+# Inputs:
+#       dictionary  -   The todo dictionary that contains all the tasks.
+#                       Completed and in progress
+# Outputs:
+#       dictionary  -   The todo dictionary that now contains only the in
+#                       progress tasks.
+###################################
+def clean_up(dictionary):
+    # Completed tasks are the value for the key "0" in the data structure.
+    cleanup_tasks = list(dictionary[0])
+    # Clear out the completed tasks in the dictionary
+    dictionary[0] = Bucket()
+    for an_entry in cleanup_tasks:
+        dictionary.forget(an_entry)
+        dictionary.touch(an_entry)
+    # Move the tasks into the archive
+    if [] != cleanup_tasks:
+        archive_tasks(cleanup_tasks)
+    # Return the dictionary that was passed in
+    return dictionary
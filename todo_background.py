@@ -18,8 +18,24 @@
 #	webex open a new tab with the address.
 ################################################################################
 from todo_util import *
+from todo_tasks import *
 import re
+import sys
 import time
+import heapq
+
+# NumPy is used to work out the new priorities of long lists when it is
+# installed, the same sums are done in Python when it isn't. Importing it
+# takes longer than ageing a short list, so it isn't imported for those.
+NUMPY_MIN_TASKS = 256
+
+# Priority and highlighting given to tasks that are past their due date.
+OVERDUE_PRI = 8
+OVERDUE_LEV = 3
+
+# How often, in seconds, the reminder watcher checks the todo file for
+# changes while it waits for the next due date.
+REMINDER_CHECK = 30
 
 ################################################################################
 #
@@ -40,7 +56,7 @@ import time
 def background(dictionary):
     day = time.localtime(time.time())
     day_of_the_week = day[5]
-    completed_tasks = dictionary[0].keys()
+    completed_tasks = list(dictionary[0])
     # Get the completed tasks, if any of the tasks were completed before the
     # beginning of the current week then clean up the dictionary.
     if "1" == day_of_the_week and len(completed_tasks) > 0:
@@ -50,6 +66,7 @@ def background(dictionary):
 	pass
     # Look through all the tasks, if any have due dates then work out if a new
     # priority should be assigned to it.
+    age_tasks(dictionary, time.time())
 
     # Today's date, due date, date_added, current priority.
     # date_diff = due_date - todays_date, the smaller this number is the
@@ -62,3 +79,231 @@ def background(dictionary):
     # less time is spent in each successive priority.
 
     return dictionary
+
+################################################################################
+#
+# Name:
+#	ageing_targets
+#
+# Description:
+#	Work out the priority each task should have at least, from how far it
+#	is from being added to being due. With progress running from 0 when
+#	added to 1 when due the priority is 1 + 7 * progress^2, so less time is
+#	spent in each successive priority as the due date gets closer. Tasks
+#	past their due date are overdue. The sums are done over whole arrays
+#	with NumPy if it's there and there are enough tasks to be worth it.
+#
+# Inputs:
+#	adds	    -	List of the times the tasks were added
+#	dues	    -	List of the times the tasks are due, in the same order
+#	now	    -	The current time
+#
+# Outputs:
+#	targets	    -	List of the priority for each task
+#	overdue	    -	List of True for each task that is overdue
+#
+################################################################################
+def ageing_targets(adds, dues, now):
+    numpy = None
+    if len(adds) >= NUMPY_MIN_TASKS:
+        try:
+            import numpy
+        except ImportError:
+            pass
+    if None != numpy:
+        adds = numpy.array(adds, dtype=float)
+        dues = numpy.array(dues, dtype=float)
+        span = dues - adds
+        # A task due when, or before, it was added is as close as it can be.
+        progress = numpy.where(span > 0,\
+            (now - adds) / numpy.where(span > 0, span, 1.0), 1.0)
+        progress = numpy.clip(progress, 0.0, 1.0)
+        targets = 1 + (7 * progress * progress).astype(int)
+        overdue = dues <= now
+        targets[overdue] = OVERDUE_PRI
+        return (targets.tolist(), overdue.tolist())
+    targets = []
+    overdue = []
+    for (add, due) in zip(adds, dues):
+        if due > add:
+            progress = min(max((now - add) / (due - add), 0.0), 1.0)
+        else:
+            progress = 1.0
+        if due <= now:
+            targets.append(OVERDUE_PRI)
+        else:
+            targets.append(1 + int(7 * progress * progress))
+        overdue.append(due <= now)
+    return (targets, overdue)
+
+################################################################################
+#
+# Name:
+#	age_tasks
+#
+# Description:
+#	Raise the priority of the tasks that have an added and a due date as
+#	they get closer to being due. A task is never lowered, so running this
+#	again straight away changes nothing. All the new priorities are worked
+#	out together and the tasks that need to move are taken out of their
+#	buckets and added to their new ones in one go for each bucket.
+#
+# Inputs:
+#	dictionary  -	The todo list
+#	now	    -	The current time
+#
+# Outputs:
+#	dictionary  -	The todo list with the tasks aged
+#
+################################################################################
+def age_tasks(dictionary, now):
+    # Completed tasks don't age, the rest are taken in the order they are
+    # displayed so moved tasks keep their order.
+    keys = [key for key in dictionary.keys() if key > 0]
+    keys.sort(reverse=True)
+    tasks = [an_entry for key in keys for an_entry in dictionary[key]\
+        if None != an_entry.due and None != an_entry.add]
+    if [] == tasks:
+        return dictionary
+    (targets, overdue) = ageing_targets([an_entry.add for an_entry in tasks],\
+        [an_entry.due for an_entry in tasks], now)
+    leaving = {}
+    arriving = {}
+    for (an_entry, target, late) in zip(tasks, targets, overdue):
+        if late and OVERDUE_LEV != an_entry.lev:
+            an_entry.lev = OVERDUE_LEV
+            dictionary.touch(an_entry)
+        if target > an_entry.pri:
+            leaving.setdefault(an_entry.pri, []).append(an_entry)
+            arriving.setdefault(target, []).append(an_entry)
+    for key in leaving:
+        dictionary[key].remove(leaving[key])
+    for key in arriving:
+        for an_entry in arriving[key]:
+            an_entry.pri = key
+            dictionary.touch(an_entry, True)
+        dictionary[key].extend(arriving[key])
+    return dictionary
+
+################################################################################
+#
+# Name:
+#	watch_reminders
+#
+# Description:
+#	Run until interrupted, giving a reminder as each task in the todo list
+#	becomes due. The due dates are kept in a heap and the watcher sleeps
+#	until the earliest one, waking only to check the todo file for changes
+#	every REMINDER_CHECK seconds. When the file has changed only the tasks
+#	whose due dates have changed are added to the heap; entries for tasks
+#	that have been changed or removed are left in it and skipped when they
+#	come to the top.
+#	Only tasks that become due after the watcher starts are reminded of.
+#
+# Inputs:
+#	file_name   -	The name of the todo file
+#
+# Outputs:
+#	N/A
+#
+################################################################################
+def watch_reminders(file_name):
+    start = time.time()
+    heap = []
+    # Task id to the due date it is waiting for in the heap, and to the due
+    # date it has been reminded of.
+    scheduled = {}
+    reminded = {}
+    dictionary = None
+    next_check = start
+    try:
+        while True:
+            now = time.time()
+            if now >= next_check:
+                if None == dictionary\
+                        or todo_version(file_name) != dictionary.version:
+                    dictionary = generate_todo_dict(file_name)
+                    schedule_reminders(dictionary, start, heap, scheduled,\
+                        reminded)
+                next_check = now + REMINDER_CHECK
+            while [] != heap and heap[0][0] <= now:
+                (due, task_id) = heapq.heappop(heap)
+                if scheduled.get(task_id) == due:
+                    del scheduled[task_id]
+                    reminded[task_id] = due
+                    give_reminder(dictionary, dictionary.ids[task_id])
+            wake = next_check
+            if [] != heap:
+                wake = min(wake, heap[0][0])
+            time.sleep(max(0.0, wake - time.time()))
+    except KeyboardInterrupt:
+        pass
+
+################################################################################
+#
+# Name:
+#	schedule_reminders
+#
+# Description:
+#	Bring the reminder heap up to date with a newly loaded todo list.
+#
+# Inputs:
+#	dictionary  -	The todo list
+#	start	    -	When the watcher started, tasks due before then are
+#			not reminded of.
+#	heap	    -	Heap of (due date, task id), updated in place
+#	scheduled   -	Dictionary of task id to the due date it is waiting
+#			for, updated in place.
+#	reminded    -	Dictionary of task id to the due date that has been
+#			reminded of, updated in place.
+#
+# Outputs:
+#	N/A
+#
+################################################################################
+def schedule_reminders(dictionary, start, heap, scheduled, reminded):
+    due_tasks = {}
+    for key in dictionary:
+        if key > 0:
+            for an_entry in dictionary[key]:
+                if None != an_entry.due and an_entry.due > start:
+                    due_tasks[an_entry.id] = an_entry.due
+    for task_id in scheduled.keys():
+        if task_id not in due_tasks:
+            del scheduled[task_id]
+    for task_id in reminded.keys():
+        if task_id not in due_tasks:
+            del reminded[task_id]
+    for (task_id, due) in due_tasks.iteritems():
+        if reminded.get(task_id) == due:
+            continue
+        if scheduled.get(task_id) != due:
+            scheduled[task_id] = due
+            heapq.heappush(heap, (due, task_id))
+    # Don't let entries that will be skipped build up.
+    if len(heap) > 2 * len(scheduled) + 64:
+        heap[:] = [(due, task_id) for (task_id, due) in scheduled.iteritems()]
+        heapq.heapify(heap)
+
+################################################################################
+#
+# Name:
+#	give_reminder
+#
+# Description:
+#	Tell the user a task is due, ringing the terminal bell.
+#
+# Inputs:
+#	dictionary  -	The todo list
+#	an_entry    -	The task that is due
+#
+# Outputs:
+#	N/A
+#
+################################################################################
+def give_reminder(dictionary, an_entry):
+    program_menu_print("\aDue now:")
+    print display_task(an_entry, task_number(dictionary, an_entry.pri,\
+        an_entry)).encode("utf-8")
+    sys.stdout.flush()
+
@@ -0,0 +1,388 @@
+#! /usr/bin/python
+
+################################################################################
+#
+# Name:
+#	todo_cli.py
+#
+# Description:
+#	This file contains the command line handling of the todo program: the
+#	options it takes and running a command against the todo and done lists.
+#	It is used both when todo.py runs a command itself and by the daemon,
+#	which keeps the lists loaded between commands.
+#
+################################################################################
+
+from todo_util import *
+from todo_tasks import *
+from todo_background import *
+
+# The done file, the archive, the menus and the command line parser are
+# imported by the commands that use them, listing the tasks (the command run
+# most often) doesn't pay for them.
+
+# The number of tasks on a page when --page is given without --top.
+PAGE_SIZE = 20
+
+# The default of every option, the parser is given these so a bare todo.py
+# gets the same options with or without it. An option added to the parser
+# needs its default here.
+LISTING_OPTIONS = {"finish": None, "remove": None, "previous": None,\
+    "modify": None, "add": False, "clean": False, "top": None, "page": None,\
+    "due_next": None, "overdue": False, "summary": False, "format": "text",\
+    "watch_reminders": False, "daemon": False}
+
+###################################
+# Purpose:
+#	Holds the parsed options when a bare todo.py is run without the command
+#	line parser.
+# Fields:
+#	One for each of the options, as the parser would set them.
+###################################
+class Options(object):
+
+    def __init__(self, options):
+        self.__dict__.update(options)
+
+###################################
+# Purpose:
+#	Used by the command line parser for options that take a count.
+# Inputs:
+#	value	    -	The value given on the command line
+# Outputs:
+#	The value as an int, it must be at least one.
+###################################
+def positive_number(value):
+    import argparse
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(value+" is not a positive number")
+    return number
+
+###################################
+# Purpose:
+#	Parse the command line options.
+# Inputs:
+#	argv	    -	The command line arguments, without the program name
+# Outputs:
+#	args	    -	The parsed options
+###################################
+def parse_args(argv):
+    # Listing the tasks takes no options, there is nothing to parse.
+    if [] == argv:
+        return Options(LISTING_OPTIONS)
+    import argparse
+    parser = argparse.ArgumentParser(prog="todo.py")
+    parser.add_argument("-f", "--finish", type=task_references, nargs="+",\
+        metavar="TASK", help="Finish tasks (by number, id or a range of "\
+        +"numbers such as 9-12) to have them crossed off the list.")
+    parser.add_argument("-r", "--remove", type=task_references, nargs="+",\
+        metavar="TASK", help="Remove tasks (by number, id or range) from "\
+        +"the list.")
+    parser.add_argument("-p", "--previous", type=int,\
+        help="Review the past week's tasks.")
+    parser.add_argument("-m", "--modify", type=task_references, nargs="+",\
+        metavar="TASK", help="Modify tasks (by number, id or range).")
+    parser.add_argument("-a", "--add", action="store_true",\
+        help="Add a new task to the task list.")
+    parser.add_argument("-c", "--clean", action="store_true",\
+        help="Clean up the list moving finished tasks to an archive.")
+    parser.add_argument("--top", type=positive_number,\
+        help="Only show the first TOP tasks, the size of a page with "\
+        +"--page.")
+    parser.add_argument("--page", type=positive_number,\
+        help="Only show page PAGE of the list, "+str(PAGE_SIZE)\
+        +" tasks to a page unless --top is given.")
+    parser.add_argument("--due-next", type=positive_number,\
+        help="Only show the DUE_NEXT tasks due soonest.")
+    parser.add_argument("--overdue", action="store_true",\
+        help="Only show the tasks that are past their due date.")
+    parser.add_argument("--summary", action="store_true",\
+        help="Only show the number of open tasks at each priority and how "\
+        +"many are overdue, quickly enough for a shell prompt.")
+    parser.add_argument("--format", choices=["text", "jsonl"],\
+        help="Show the tasks as coloured text, or as one "\
+        +"JSON object per line for other programs.")
+    parser.add_argument("--watch-reminders", action="store_true",\
+        help="Keep running, giving a reminder as each task becomes due.")
+    parser.add_argument("--daemon", action="store_true",\
+        help="Keep the lists loaded and serve commands from other runs of "\
+        +"todo.py.")
+    parser.set_defaults(**LISTING_OPTIONS)
+    return parser.parse_args(argv)
+
+###################################
+# Purpose:
+#	Hands out the todo list and the done history for a command. Run once
+#	it simply loads them; kept by the daemon it holds on to what it loaded
+#	and only loads them again when the files they came from have changed.
+# Fields:
+#	todo_key    -	The file keys the todo list was loaded with
+#	todo	    -	The todo list, None if not loaded
+#	history_key -	The window and file keys the history was loaded with
+#	history	    -	The completed dictionary, None if not loaded
+#	history_days -	The history grouped by day (see bucket_done_days)
+###################################
+class TaskStore(object):
+
+    def __init__(self):
+        self.todo_key = None
+        self.todo = None
+        self.history_key = None
+        self.history = None
+        self.history_days = None
+
+    ###################################
+    # Purpose:
+    #	Get the todo list.
+    # Inputs:
+    #	file_name   -	The name of the todo file
+    # Outputs:
+    #	The todo list
+    ###################################
+    def load_todo(self, file_name):
+        key = (file_key(file_name), file_key(journal_name(file_name)))
+        if None == self.todo or key != self.todo_key:
+            self.todo = generate_todo_dict(file_name)
+            self.todo_key = key
+        return self.todo
+
+    ###################################
+    # Purpose:
+    #	Get the first tasks of the todo list, loading only those from the
+    #	file if the whole list isn't loaded already and the file allows it.
+    # Inputs:
+    #	file_name   -	The name of the todo file
+    #	count	    -	The number of tasks wanted
+    # Outputs:
+    #	A todo list holding at least the first count tasks
+    ###################################
+    def load_todo_top(self, file_name, count):
+        key = (file_key(file_name), file_key(journal_name(file_name)))
+        if None != self.todo and key == self.todo_key:
+            return self.todo
+        dictionary = load_todo_top(file_name, count)
+        if None == dictionary:
+            dictionary = self.load_todo(file_name)
+        return dictionary
+
+    ###################################
+    # Purpose:
+    #	Save the todo list if it has changed, keeping note of the files as
+    #	they are now so the list isn't loaded again.
+    # Inputs:
+    #	file_name   -	The name of the todo file
+    # Outputs:
+    #	The todo list as saved, changes made by other runs of the program
+    #	may have been added to it. None if the list wasn't loaded.
+    ###################################
+    def save_todo(self, file_name):
+        # Nothing can have changed if only the top of the list was loaded.
+        if None == self.todo:
+            return None
+        self.todo = save_todo(self.todo, file_name)
+        self.todo_key = (file_key(file_name),\
+            file_key(journal_name(file_name)))
+        return self.todo
+
+    ###################################
+    # Purpose:
+    #	Get the tasks completed since a given time.
+    # Inputs:
+    #	file_name   -	The name of the done file
+    #	since	    -	Time in seconds since the epoch
+    # Outputs:
+    #	The completed dictionary
+    ###################################
+    def load_history(self, file_name, since):
+        from todo_archive import archive_path, load_history
+        from todo_fin import bucket_done_days
+        key = (since, file_key(file_name),\
+            file_key(archive_path()+"/manifest"))
+        if None == self.history or key != self.history_key:
+            self.history = load_history(file_name, since)
+            self.history_days = bucket_done_days(self.history)
+            self.history_key = key
+        return self.history
+
+    ###################################
+    # Purpose:
+    #	Forget what has been loaded, used when a command fails part way
+    #	through and may have left the todo list half changed.
+    # Inputs:
+    #	N/A
+    # Outputs:
+    #	N/A
+    ###################################
+    def reset(self):
+        self.__init__()
+
+###################################
+# Purpose:
+#	Work out which tasks to display from the --top and --page options.
+# Inputs:
+#	args	    -	The parsed options
+# Outputs:
+#	first	    -	The number of the first task to display
+#	last	    -	The number of the last task to display, None for all
+###################################
+def display_window(args):
+    if None == args.top and None == args.page:
+        return (1, None)
+    size = args.top or PAGE_SIZE
+    page = args.page or 1
+    return ((page - 1) * size + 1, page * size)
+
+###################################
+# Purpose:
+#	Find the tasks given to -f, -r or -m. Every task is found before any
+#	is changed, so the numbers are those of the list as it was displayed.
+# Inputs:
+#	dictionary  -	The todo list
+#	values	    -	The parsed option, a list of lists of task references
+# Outputs:
+#	List of (key, an_entry, number) as from resolve_tasks
+###################################
+def chosen_tasks(dictionary, values):
+    return resolve_tasks(dictionary,\
+        [reference for references in values for reference in references])
+
+###################################
+# Purpose:
+#	Build the display of some of the tasks in the todo list, with the
+#	numbers they have in the full list.
+# Inputs:
+#	dictionary  -	The todo list
+#	tasks	    -	The Tasks to display, in order
+#	output	    -	"text" or "jsonl", as --format
+# Outputs:
+#	Generates the display of each task in turn.
+###################################
+def generate_due_lines(dictionary, tasks, output):
+    for an_entry in tasks:
+        number = task_number(dictionary, an_entry.pri, an_entry)
+        if "jsonl" == output:
+            yield task_record(an_entry, number)
+        else:
+            yield display_task(an_entry, number)+"\n"
+
+###################################
+# Purpose:
+#	Run a single command of the todo program. Cleaning up holds the lock
+#	on the todo list from loading it to saving it, so two clean ups at
+#	once can't both archive the same tasks.
+# Inputs:
+#	argv	    -	The command line arguments, without the program name
+#	store	    -	The TaskStore to get the lists from
+# Outputs:
+#	N/A
+###################################
+def run_command(argv, store):
+    args = parse_args(argv)
+    if not args.clean:
+        run_args(args, store)
+        return
+    file_name = os.getenv("HOME")+"/tasks/todo"
+    acquire_lock(file_name)
+    try:
+        run_args(args, store)
+    finally:
+        release_lock(file_name)
+
+###################################
+# Purpose:
+#	Run a single command of the todo program.
+# Inputs:
+#	args	    -	The parsed options
+#	store	    -	The TaskStore to get the lists from
+# Outputs:
+#	N/A
+###################################
+def run_args(args, store):
+    home = os.getenv("HOME")
+    path = home+"/tasks"
+    if args.watch_reminders:
+        watch_reminders(path+"/todo")
+        return
+    if args.summary:
+        print_summary(path+"/todo", args.format)
+        return
+    task_dict = {}
+    (first, last) = display_window(args)
+    # Only these commands change the list, the others only read it and never
+    # write it back.
+    changing = args.finish or args.add or args.remove or args.modify\
+        or args.clean
+    listing = not (changing or args.due_next or args.overdue)
+    if args.finish or args.add or args.remove or args.modify:
+        from todo_menu import add_task_menu, add_subtasks_menu, modify_task,\
+            remove_task
+    if args.previous:
+        from todo_fin import generate_done_json, generate_done_display,\
+            done_window_start
+        # Only the weeks being reviewed are loaded from the done file and
+        # the archive.
+        file_name = path+"/done"
+        task_dict = store.load_history(file_name,\
+            done_window_start(args.previous))
+    elif listing and None != last:
+        # Only the tasks being displayed need to be loaded.
+        file_name = path+"/todo"
+        task_dict = store.load_todo_top(file_name, last)
+    else:
+        file_name = path+"/todo"
+        task_dict = store.load_todo(file_name)
+    if args.finish:
+        for (key, an_entry, number) in chosen_tasks(task_dict, args.finish):
+            task_dict = modify_task(task_dict, key, an_entry, number)
+    elif args.add:
+        (line, pri, lev, due, success) = add_task_menu()
+        if success:
+            (task_dict, new_task) = add_task(task_dict, line, pri, lev, due)
+            program_menu_print("Would you like to add subtasks [y/N]")
+            ui = raw_input()
+            if "y" == ui.lower():
+                task_dict = add_subtasks_menu(task_dict, new_task)
+            else:
+                program_menu_print("No subtasks added.")
+    elif args.remove:
+        for (key, an_entry, number) in chosen_tasks(task_dict, args.remove):
+            task_dict = remove_task(task_dict, key, an_entry, number)
+    elif args.modify:
+        for (key, an_entry, number) in chosen_tasks(task_dict, args.modify):
+            task_dict = modify_task(task_dict, key, an_entry, number, False)
+    elif args.previous and "text" == args.format:
+        print "Displaying "+str(args.previous)+" previous week(s)."
+    elif args.clean:
+        from todo_archive import clean_up
+        task_dict = clean_up(task_dict)
+    if changing:
+        # Raise the priority of tasks that are getting close to being due.
+        # This is done after the command so the tasks it was given by
+        # number were found with the numbering last displayed. Reads show
+        # the list as saved, so every read numbers the tasks the same way.
+        background(task_dict)
+        # Save before displaying so the list shown is the list saved.
+        saved = store.save_todo(file_name)
+        if None != saved:
+            task_dict = saved
+    if args.previous:
+        # Reviewing only displays the done file, and only part of it has been
+        # loaded, so it is not written back.
+        if "jsonl" == args.format:
+            write_display(generate_done_json(task_dict, args.previous,\
+                store.history_days), False)
+        else:
+            write_display(generate_done_display(task_dict, args.previous,\
+                store.history_days))
+    elif args.due_next or args.overdue:
+        if args.overdue:
+            tasks = due_soonest(task_dict, args.due_next, time.time())
+        else:
+            tasks = due_soonest(task_dict, args.due_next)
+        write_display(generate_due_lines(task_dict, tasks, args.format),\
+            "text" == args.format)
+    elif "jsonl" == args.format:
+        write_display(generate_json_lines(task_dict, first, last), False)
+    else:
+        write_display(generate_display_lines(task_dict, first, last))
@@ -0,0 +1,132 @@
+#! /usr/bin/python
+
+################################################################################
+#
+# Name:
+#	todo_client.py
+#
+# Description:
+#	This file contains the client side of the todo daemon. It only needs
+#	the standard library so a command can be passed to a running daemon
+#	without loading the rest of the program. The socket and json modules
+#	are only imported once there is a daemon to talk to.
+#
+#	Messages in both directions are frames of a one letter type, a four
+#	byte length and then the data.
+#	  Client to daemon:
+#	    a	-   The command line arguments as a JSON list
+#	    i	-   A line typed by the user, empty at the end of input
+#	  Daemon to client:
+#	    o	-   Output for stdout
+#	    x	-   Output for stderr
+#	    r	-   The command wants a line of input
+#	    e	-   The command has finished, the data is the exit status
+#
+################################################################################
+
+import os
+import sys
+import struct
+
+FRAME_HEADER = struct.Struct("!cI")
+
+###################################
+# Purpose:
+#	Get the name of the socket the daemon listens on.
+# Inputs:
+#	N/A
+# Outputs:
+#	The name of the socket, ~/tasks/.todo.sock
+###################################
+def socket_name():
+    return os.getenv("HOME")+"/tasks/.todo.sock"
+
+###################################
+# Purpose:
+#	Send a frame.
+# Inputs:
+#	sock	    -	The connected socket
+#	kind	    -	The type of the frame
+#	data	    -	The data to send
+# Outputs:
+#	N/A
+###################################
+def send_frame(sock, kind, data):
+    sock.sendall(FRAME_HEADER.pack(kind, len(data))+data)
+
+###################################
+# Purpose:
+#	Read exactly the number of bytes asked for from a socket.
+# Inputs:
+#	sock	    -	The connected socket
+#	size	    -	The number of bytes to read
+# Outputs:
+#	The bytes read, None if the connection closed first.
+###################################
+def receive_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if "" == chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return "".join(chunks)
+
+###################################
+# Purpose:
+#	Receive a frame.
+# Inputs:
+#	sock	    -	The connected socket
+# Outputs:
+#	(kind, data) of the frame, (None, None) if the connection closed.
+###################################
+def receive_frame(sock):
+    header = receive_exactly(sock, FRAME_HEADER.size)
+    if None == header:
+        return (None, None)
+    (kind, size) = FRAME_HEADER.unpack(header)
+    data = receive_exactly(sock, size)
+    if None == data:
+        return (None, None)
+    return (kind, data)
+
+###################################
+# Purpose:
+#	Pass a command to the daemon and relay its output, and the user's
+#	input, until it has finished.
+# Inputs:
+#	argv	    -	The command line arguments, without the program name
+# Outputs:
+#	The exit status of the command, None if there is no daemon running.
+###################################
+def forward(argv):
+    if not os.path.exists(socket_name()):
+        return None
+    import json
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_name())
+    except socket.error:
+        sock.close()
+        return None
+    try:
+        send_frame(sock, "a", json.dumps(argv))
+        while True:
+            (kind, data) = receive_frame(sock)
+            if "o" == kind:
+                sys.stdout.write(data)
+            elif "x" == kind:
+                sys.stderr.write(data)
+            elif "r" == kind:
+                sys.stdout.flush()
+                send_frame(sock, "i", sys.stdin.readline())
+            elif "e" == kind:
+                sys.stdout.flush()
+                return int(data)
+            else:
+                sys.stderr.write("Lost the connection to the todo daemon.\n")
+                return 1
+    finally:
+        sock.close()
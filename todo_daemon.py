@@ -0,0 +1,246 @@
+#! /usr/bin/python
+
+################################################################################
+#
+# Name:
+#	todo_daemon.py
+#
+# Description:
+#	This file contains the todo daemon, started with todo.py --daemon. It
+#	keeps the todo list and the done history loaded and runs the commands
+#	passed to it by todo.py over a Unix socket, so a command doesn't pay
+#	for starting the program and loading the lists each time. Commands are
+#	run exactly as todo.py would run them, with their output and the
+#	user's input passed over the socket. Commands that ask the user
+#	questions (-a, -m and -r) are run in a child process so the daemon can
+#	go on serving other commands while they wait. The child saves the list
+#	under the same lock as any other change, and the daemon loads the list
+#	again when it sees the file has changed.
+#
+################################################################################
+
+from todo_client import *
+from todo_cli import *
+import json
+import socket
+import errno
+import StringIO
+import traceback
+
+###################################
+# Purpose:
+#	Stands in for stdout or stderr while a command runs, sending what is
+#	written to the client.
+# Fields:
+#	sock	    -	The socket connected to the client
+#	kind	    -	The type of frame the output is sent in
+#	buffered    -	Output not sent yet
+#	size	    -	The number of bytes in buffered
+#	softspace   -	Used by print
+###################################
+class SocketOutput(object):
+
+    def __init__(self, sock, kind):
+        self.sock = sock
+        self.kind = kind
+        self.buffered = []
+        self.size = 0
+        self.softspace = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        self.buffered.append(data)
+        self.size += len(data)
+        # Long output is sent as it is made rather than held until the end.
+        if self.size >= WRITE_BUFFER:
+            self.flush()
+
+    def flush(self):
+        if [] != self.buffered:
+            send_frame(self.sock, self.kind, "".join(self.buffered))
+            self.buffered = []
+            self.size = 0
+
+###################################
+# Purpose:
+#	Stands in for stdin while a command runs, asking the client for each
+#	line the command reads.
+# Fields:
+#	sock	    -	The socket connected to the client
+#	output	    -	The SocketOutput for stdout, flushed so the user sees
+#			the question before the answer is asked for.
+###################################
+class SocketInput(object):
+
+    def __init__(self, sock, output):
+        self.sock = sock
+        self.output = output
+
+    def readline(self):
+        self.output.flush()
+        send_frame(self.sock, "r", "")
+        (kind, data) = receive_frame(self.sock)
+        if "i" != kind:
+            # The client has gone, treat it as the end of input.
+            return ""
+        return data
+
+###################################
+# Purpose:
+#	Work out if a command asks the user questions, and so may wait on
+#	them for as long as they take to answer.
+# Inputs:
+#	argv	    -	The command line arguments
+# Outputs:
+#	True if the command adds, modifies or removes tasks. Commands the
+#	parser rejects don't wait, their error is given when they are run.
+###################################
+def waits_for_user(argv):
+    saved = (sys.stdout, sys.stderr)
+    (sys.stdout, sys.stderr) = (StringIO.StringIO(), StringIO.StringIO())
+    try:
+        args = parse_args(argv)
+    except SystemExit:
+        return False
+    finally:
+        (sys.stdout, sys.stderr) = saved
+    return args.add or None != args.modify or None != args.remove
+
+###################################
+# Purpose:
+#	Take a command from a client and run it. A command that asks the user
+#	questions is run in a child process, the rest are run by the daemon
+#	one at a time.
+# Inputs:
+#	sock	    -	The socket connected to the client
+#	store	    -	The TaskStore holding the loaded lists
+# Outputs:
+#	N/A
+###################################
+def serve_client(sock, store):
+    (kind, data) = receive_frame(sock)
+    if "a" != kind:
+        return
+    argv = json.loads(data)
+    if not waits_for_user(argv):
+        run_client(sock, store, argv)
+        return
+    if 0 != os.fork():
+        return
+    # The child must never return into the daemon's loop.
+    try:
+        try:
+            run_client(sock, store, argv)
+        except socket.error:
+            pass
+    finally:
+        os._exit(0)
+
+###################################
+# Purpose:
+#	Reap the children that have finished running commands.
+# Inputs:
+#	N/A
+# Outputs:
+#	N/A
+###################################
+def reap_children():
+    while True:
+        try:
+            (pid, status) = os.waitpid(-1, os.WNOHANG)
+        except OSError as e:
+            if errno.ECHILD == e.errno:
+                return
+            raise
+        if 0 == pid:
+            return
+
+###################################
+# Purpose:
+#	Run a command for a client with stdin, stdout and stderr connected to
+#	the client.
+# Inputs:
+#	sock	    -	The socket connected to the client
+#	store	    -	The TaskStore holding the loaded lists
+#	argv	    -	The command line arguments sent by the client
+# Outputs:
+#	N/A
+###################################
+def run_client(sock, store, argv):
+    output = SocketOutput(sock, "o")
+    errors = SocketOutput(sock, "x")
+    saved = (sys.stdin, sys.stdout, sys.stderr)
+    (sys.stdin, sys.stdout, sys.stderr) =\
+        (SocketInput(sock, output), output, errors)
+    status = 0
+    try:
+        try:
+            run_command(argv, store)
+        except SystemExit as e:
+            if None == e.code or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                print >> sys.stderr, e.code
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        if 0 != status:
+            # The command may have stopped part way through changing the
+            # list, load it again for the next one.
+            store.reset()
+    finally:
+        (sys.stdin, sys.stdout, sys.stderr) = saved
+    output.flush()
+    errors.flush()
+    send_frame(sock, "e", str(status))
+
+###################################
+# Purpose:
+#	Listen on the daemon's socket and run the commands sent to it until
+#	interrupted.
+# Inputs:
+#	N/A
+# Outputs:
+#	N/A
+###################################
+def serve():
+    name = socket_name()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(name):
+        # Only take over the socket if nothing is listening on it.
+        try:
+            listener.connect(name)
+            listener.close()
+            print "The todo daemon is already running."
+            return 1
+        except socket.error:
+            listener.close()
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            os.remove(name)
+    # Only the user can connect to the socket.
+    old_mask = os.umask(0077)
+    try:
+        listener.bind(name)
+    finally:
+        os.umask(old_mask)
+    listener.listen(5)
+    store = TaskStore()
+    try:
+        while True:
+            (sock, address) = listener.accept()
+            reap_children()
+            try:
+                serve_client(sock, store)
+            except socket.error:
+                # The client went away, there is nobody to tell.
+                store.reset()
+            finally:
+                sock.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        os.remove(name)
+    return 0
@@ -12,199 +12,362 @@
 from todo_util import *
 import re
 import time
+import errno
+import mmap
+import bisect
+import array
+import cPickle
 
 ###################################
 # Purpose:
-#	This function generates the completed dictionary from the file provided.
-#	Meta data is picked up from flags to be stored.
+#	Build the completed dictionary from the lines of the done file. Meta
+#	data is picked up from flags to be stored.
 # Inputs:
-#	file_name   -	The name of the file that contains the task list.
+#	contents    -	The lines of the done file
 # Outputs:
-#	dictionary  -	The task list represented in the following structure.
+#	dictionary  -	The completed task list represented in the following
+#			structure.
 #
-#	{completed:{
-#	    task_number: {
-#			    "line":<text>
-#			    "pri":4
-#			    "lev":0
-#		    	    "sub":{ <empty> or
-#				    task_numer:{"line":<text>
-#					"comp":<number>}
-#				  }
-#			 }
-#		    }
+#	{completed:[
+#	    Task(line, pri=0, lev=10, add, due,
+#		 sub=[Subtask(task, completed), ...]),
+#	    (More tasks completed at the same time)
+#	    ]
 #	}
 #
 ###################################
-def generate_done_dictionary (file_name):
-    # Read the file into a list
-    contents = read_file(file_name)
+def parse_done_lines(contents):
     dictionary = {}
     l = len(contents)
     count = 0
 
     # Do the following until count equals the number of lines
     while count < l:
-	# Choose the line, strip comments, remove last character
+        # Choose the line, strip comments, remove last character
         line = contents[count]
-        line = re.sub("#.*$", "", line)
+        line = COMMENT_REGEX.sub("", line)
         line = line[:-1]
-	# Remove all the non-letter characters at the beginning of the line.
-        line = re.sub("^[^a-zA-Z]+", "", line)
+        # Remove all the non-letter characters at the beginning of the line.
+        line = TASK_PREFIX_REGEX.sub("", line)
 
-	# If there is anything left on the line process it.
+        # If there is anything left on the line process it.
         if line != "":
-	    # Get the date of completion (this should always exist
-            match = re.search("--comp=(\d+\.\d+)", line)
-            if None != match:
-                comp = match.group(1)
-            else:
-                comp = 0
-	    match = re.search("--add=(\d+\.\d+)", line)
-	    if None != match:
-		added = match.group(1)
-	    else:
-		added = 0
-	    match = re.search("--due=(\d+\.\d+)", line)
-	    if None != match:
-		due = match.group(1)
-	    else:
-		due = 0
-	    # Get rid of any remaining meta data
-            sanitize = strip_internal_format(line)
-	    # Check if any other tasks were completed at the same time.
-	    # Time of completion is the identifier for this dictionary.
+            # Split the line into the text and the meta data. The date of
+            # completion should always exist.
+            sanitize, flags = tokenize_line(line)
+            comp = flags.get("comp", 0.0)
+            entry = Task(sanitize, 0, 10, add=flags.get("add"),\
+                due=flags.get("due"), id=flags.get("id"))
+            # Check if any other tasks were completed at the same time.
+            # Time of completion is the identifier for this dictionary.
             if comp in dictionary:
-                task_num = len(dictionary[comp])
+                dictionary[comp].append(entry)
             else:
-		dictionary[comp] = {}
-		task_num = 0
-	    dictionary[comp][task_num] = {"line": sanitize, "pri": 0, "lev":10,\
-			"sub":{}}
-	    if added > 0:
-		dictionary[comp][task_num]["add"] = added
-	    if due > 0:
-		dictionary[comp][task_num]["due"] = due
-            # If there is one element len = 1 but to access this element it's 0
-	    # so subtract one to access elements
-	    task_num = len(dictionary[comp]) - 1
-	    entry = dictionary[comp][task_num]
-	    # Check for subtasks as well
+                dictionary[comp] = [entry]
+            # Check for subtasks as well
             count = check_for_sublevels(entry, count, contents)
         count += 1
     return dictionary
 
+# The done file grows forever so it has an index of where each completed
+# task starts in the file, sorted by the time of completion. This lets a
+# review of the last few weeks read only those weeks from the file. Bump the
+# version if the layout of the index changes.
+DONE_INDEX_VERSION = 2
+
+# Byte level versions of the regexes used by the parser, the index is built
+# without decoding the file.
+RAW_COMMENT_REGEX = re.compile(r"#.*$")
+RAW_TASK_PREFIX_REGEX = re.compile(r"^[^a-zA-Z]+")
+RAW_COMP_REGEX = re.compile(r"--comp=(\d+\.\d+)")
+
 ###################################
 # Purpose:
-#	Turn a dictionary back into a string that can be printed to a file.
-#
+#	Scan part of the done file recording where each completed task starts
+#	and ends and when it was completed.
 # Inputs:
-#	dictionary  -	The dictionary that is to be made into a sting again.
-#
+#	data	    -	The contents of the done file (a string or mmap)
+#	offset	    -	Where in the file to start scanning, this must be the
+#			start of a task.
 # Outputs:
-#	task_string -	The string representation of the dictionary that is to
-#			be printed to a file.
-###################################
-def generate_done_string(dictionary):
-    # Get the ditionaries keys and sort them in order.
-    keys = dictionary.keys()
-    keys.sort()
-
-    # Depending on the way sort works either the newest or the oldest task will
-    # be written to the file first.
-    task_number = 1
-    file_string = ""
-
-    # Loop through all the keys and convert them to the file format that has
-    # been predetermined.
-    for key in keys:
-        day = dictionary[key]
-        # Get all the tasks that were completed at a particular time.
-	tasks = day.keys()
-        for task in tasks:
-	    # Get the value for each key.
-            an_entry = day[task]
-	    # Add the task and completion time to the string.
-            task_string = str(task_number)+") "+an_entry["line"]
-            task_string += " --comp="+str(str(key))
-	    if "add" in an_entry:
-		task_string += " --add="+str(an_entry["add"])
-	    if "due" in an_entry:
-		task_string += " --due="+str(an_entry["due"])
-            task_string += "\n"
-	    # Add any and all subtasks to the file string as well.
-            if an_entry["sub"] != {}:
-                sublevels = an_entry["sub"]
-                alpha = "abcdefghijklmnopqrstuvwxyz"
-                subkeys = sublevels.keys()
-                for key in subkeys:
-                    task_string += "\t"+alpha[key]+") "+sublevels[key]["task"]
-                    if "completed" in sublevels[key]:
-                        task_string += " --comp="+str(sublevels[key]\
-                            ["completed"])
-                    task_string+="\n"
-	    # Add each task to the file string that will be returned to the
-	    # caller.
-            file_string += task_string
-            task_number += 1
-    return file_string
+#	records	    -	List of (completed, start, end) for each task found.
+#			Subtasks are part of the task above them.
+###################################
+def scan_done_records(data, offset):
+    records = []
+    size = len(data)
+    start = -1
+    comp = 0.0
+    while offset < size:
+        end = data.find("\n", offset)
+        if -1 == end:
+            end = size
+        else:
+            end += 1
+        line = data[offset:end]
+        # Subtasks belong to the task above them.
+        if None == SUBTASK_REGEX.match(line):
+            line = RAW_COMMENT_REGEX.sub("", line)[:-1]
+            line = RAW_TASK_PREFIX_REGEX.sub("", line)
+            if line != "":
+                if -1 != start:
+                    records.append((comp, start, offset))
+                start = offset
+                match = RAW_COMP_REGEX.search(line)
+                if None != match:
+                    comp = float(match.group(1))
+                else:
+                    comp = 0.0
+        offset = end
+    if -1 != start:
+        records.append((comp, start, size))
+    return records
 
 ###################################
 # Purpose:
-#	This function is used to print the tasks that have been completed to the
-#	command line. This function prints out the tasks that have been
-#	completed in the past 7 days but only prints days where a task was
-#	completed.
-#
+#	Read the index of the done file from its sidecar. The sidecar holds a
+#	small pickled header followed by the three arrays written with
+#	array.tofile, so loading it doesn't unpickle a record for each task.
 # Inputs:
-#	dictionary  -	The dictionary that is to be printed to the command
-#			line.
+#	file_name   -	The name of the done file
 # Outputs:
-#	display_string	-   The string that is to be displayed.
-###################################
-def display_done(dictionary, weeks):
-# Sort dictionary based on date from this date to seven days previously
-#   Get today's date time.localtime()
-#   Normalise to be a full day (year, month, day, 23, 59, 59, ?, ?, ?)
-#   Get seven days previously millisecond time of this ^ - 7 * millisecond day
-#   dictionaryionary has the time of completion as the keys.
-    display_string = ""
-    keys = dictionary.keys()
+#	header	    -	Dictionary of the key, size and tail of the file the
+#			index was made from and the number of tasks in it.
+#	times	    -	As load_done_index
+#	starts	    -	As load_done_index
+#	ends	    -	As load_done_index
+#	None if there is no index or it can't be read.
+###################################
+def read_done_index(file_name):
+    try:
+        file_handle = open(sidecar_name(file_name, "idx"), "rb")
+        try:
+            header = cPickle.load(file_handle)
+            arrays = []
+            for code in ("d", "L", "L"):
+                values = array.array(code)
+                values.fromfile(file_handle, header["count"])
+                arrays.append(values)
+        finally:
+            file_handle.close()
+    except Exception:
+        return None
+    return (header, arrays[0], arrays[1], arrays[2])
+
+###################################
+# Purpose:
+#	Load the index for the done file, bringing it up to date first if the
+#	file has changed. When tasks have only been appended to the file only
+#	the new part of the file is scanned.
+# Inputs:
+#	file_name   -	The name of the done file
+#	data	    -	The contents of the done file (a string or mmap)
+#	stat	    -	os.fstat of the done file
+# Outputs:
+#	times	    -	Sorted array of the completion times
+#	starts	    -	Array of where each task starts, in the same order
+#	ends	    -	Array of where each task ends, in the same order
+###################################
+def load_done_index(file_name, data, stat):
+    key = (DONE_INDEX_VERSION, stat.st_ino, stat.st_size, stat.st_mtime)
+    index = read_done_index(file_name)
+    if None != index and index[0]["key"] == key:
+        return index[1:]
+
+    # If the old part of the file is exactly as it was when the index was
+    # made only the last task and anything after it need to be scanned. The
+    # last task in the file is the one that starts furthest in, it is
+    # scanned again as subtasks may have been added to it.
+    arrays = None
+    if None != index:
+        (header, times, starts, ends) = index
+        size = header["size"]
+        tail = header["tail"]
+        if header["key"][:2] == key[:2] and size < stat.st_size\
+                and 0 != header["count"]\
+                and data[size - len(tail):size] == tail:
+            last = starts.index(max(starts))
+            offset = starts[last]
+            for values in (times, starts, ends):
+                del values[last]
+            # New tasks go after any completed at the same time, which keeps
+            # the file order for ties.
+            for (comp, start, end) in scan_done_records(data, offset):
+                i = bisect.bisect_right(times, comp)
+                times.insert(i, comp)
+                starts.insert(i, start)
+                ends.insert(i, end)
+            arrays = (times, starts, ends)
+    if None == arrays:
+        records = scan_done_records(data, 0)
+        # Sort on time of completion keeping the file order for ties.
+        order = sorted(xrange(len(records)), key=lambda i: records[i][0])
+        arrays = (array.array("d", [records[i][0] for i in order]),\
+            array.array("L", [records[i][1] for i in order]),\
+            array.array("L", [records[i][2] for i in order]))
+
+    header = {"key": key, "size": stat.st_size, "count": len(arrays[0]),\
+        "tail": data[max(0, stat.st_size - 64):stat.st_size]}
+    def write(file_handle):
+        cPickle.dump(header, file_handle, cPickle.HIGHEST_PROTOCOL)
+        for values in arrays:
+            values.tofile(file_handle)
+    save_sidecar(file_name, "idx", write)
+    return arrays
+
+###################################
+# Purpose:
+#	Work out the earliest completion time that is shown when reviewing the
+#	previous weeks.
+# Inputs:
+#	weeks	    -	The number of weeks being reviewed
+# Outputs:
+#	The time in seconds since the epoch the review starts at
+###################################
+def done_window_start(weeks):
     today = time.localtime()
     new_time = (today[0], today[1], today[2], 23, 59, 59, -1, -1, -1)
-    s_in_a_day = 86400.0
-    day_of_the_week = time.mktime(new_time)
-    menu_pri = WHITE+DARKEN
-    while day_of_the_week > (time.mktime(new_time) - (s_in_a_day *(8 * weeks))):
-    # Print date
-    # Day of the week is currently the max of the day
-    # Get the start of the day
-    # If any tasks fall between these times print the date and the task
-	tmp_list = []
-	for key in keys:
-	    number_key = float(key)
-	    if number_key < day_of_the_week and\
-		    number_key > (day_of_the_week - s_in_a_day):
-		tmp_list += [key]
-	if [] != tmp_list:
-	    display_string += menu_highlight ("Tasks completed on " +\
-		time.strftime("%a, %d %b %Y", time.localtime(day_of_the_week))\
-		+ "\n"+ESCP)
-	    for days in tmp_list:
-		count =1
-		tasks = dictionary[days]
-		for task in tasks:
-		    an_entry = tasks[task]
-		    task_string = display_tasks({count: {count : an_entry}})\
-			    +"\n"
-		    display_string += re.sub("1\) ", str(count)+") ",\
-			    task_string)
-		    count += 1
-
-    # Print all the tasks that were completed on this day
-    # Advance date, repeat until the week has completed
-        day_of_the_week = day_of_the_week - s_in_a_day
-
-# Any items that are passed this last date move to the archive.
-#   (Some how)
-    return display_string
+    return time.mktime(new_time) - (86400.0 * (8 * weeks))
+
+###################################
+# Purpose:
+#	Load only the tasks completed since a given time from the done file.
+#	The file is memory mapped and the index is used to find the tasks, so
+#	only the tasks in the window are parsed.
+# Inputs:
+#	file_name   -	The name of the done file
+#	since	    -	Time in seconds since the epoch, tasks completed before
+#			this are not loaded.
+# Outputs:
+#	dictionary  -	The completed dictionary (as parse_done_lines)
+#			holding only the tasks in the window, empty if there is
+#			no done file. Clean up moves tasks to the archive, so
+#			the done file only exists for older lists.
+###################################
+def load_done_window(file_name, since):
+    try:
+        file_handle = open(file_name, "rb")
+    except IOError as e:
+        if errno.ENOENT == e.errno:
+            return {}
+        print "Problem with the file\nError message ({0}): {1}".format(e.errno,\
+            e.strerror)
+        exit(e.errno)
+    try:
+        stat = os.fstat(file_handle.fileno())
+        # An empty file can't be memory mapped, there's nothing to load anyway
+        if 0 == stat.st_size:
+            return {}
+        data = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (times, starts, ends) = load_done_index(file_name, data, stat)
+            first = bisect.bisect_left(times, since)
+            chunks = []
+            for i in xrange(first, len(times)):
+                chunk = data[starts[i]:ends[i]]
+                if not chunk.endswith("\n"):
+                    chunk += "\n"
+                chunks.append(chunk)
+        finally:
+            data.close()
+    finally:
+        file_handle.close()
+    try:
+        contents = "".join(chunks).decode("utf-8").splitlines(True)
+    except UnicodeDecodeError:
+        print "Something went wrong while reading the file. Encoding maybe."
+        exit(0)
+    return parse_done_lines(contents)
+
+###################################
+# Purpose:
+#	Group the completed dictionary by the local calendar day the tasks
+#	were completed on. The completion times are sorted once and the end of
+#	each day is found with bisect, so the local time is only worked out
+#	once for each day rather than for each task.
+# Inputs:
+#	dictionary  -	The completed dictionary
+# Outputs:
+#	days	    -	Sorted list of the start of each day (local midnight)
+#			that has a completed task, in seconds since the epoch.
+#	buckets	    -	List in the same order as days, each a list of the
+#			completion times on that day, sorted.
+###################################
+def bucket_done_days(dictionary):
+    comps = sorted(dictionary.keys())
+    days = []
+    buckets = []
+    first = 0
+    while first < len(comps):
+        day = time.localtime(comps[first])
+        start = time.mktime((day[0], day[1], day[2], 0, 0, 0, -1, -1, -1))
+        end = time.mktime((day[0], day[1], day[2] + 1, 0, 0, 0, -1, -1, -1))
+        last = bisect.bisect_left(comps, end, first)
+        days.append(start)
+        buckets.append(comps[first:last])
+        first = last
+    return (days, buckets)
+
+###################################
+# Purpose:
+#	Find the days with completed tasks in the past weeks.
+# Inputs:
+#	weeks	    -	The number of weeks
+#	days	    -	The dictionary grouped by day (see bucket_done_days)
+# Outputs:
+#	The positions of the days in the window in days, newest first.
+###################################
+def done_window_days(weeks, days):
+    day_starts = days[0]
+    today = time.localtime()
+    end = time.mktime((today[0], today[1], today[2], 23, 59, 59, -1, -1, -1))
+    first = bisect.bisect_right(day_starts, done_window_start(weeks))
+    last = bisect.bisect_left(day_starts, end)
+    return xrange(last - 1, first - 1, -1)
+
+###################################
+# Purpose:
+#	Build the JSON objects for the tasks completed in the past weeks, one
+#	line each, in the same order and with the same numbers as they are
+#	displayed.
+# Inputs:
+#	dictionary  -	The completed dictionary
+#	weeks	    -	The number of weeks
+#	days	    -	The dictionary grouped by day (see bucket_done_days)
+# Outputs:
+#	Generates the line for each task in turn.
+###################################
+def generate_done_json(dictionary, weeks, days):
+    buckets = days[1]
+    for i in done_window_days(weeks, days):
+        for comp in buckets[i]:
+            count = 1
+            for an_entry in dictionary[comp]:
+                yield task_record(an_entry, count, comp)
+                count += 1
+
+###################################
+# Purpose:
+#	Build the display of the tasks completed in the past weeks one day at a
+#	time, newest first. Only the days in the window are visited.
+# Inputs:
+#	dictionary  -	The completed dictionary
+#	weeks	    -	The number of weeks to display
+#	days	    -	The dictionary grouped by day (see bucket_done_days)
+# Outputs:
+#	display_string	-   Generates the heading for each day followed by the
+#			    tasks completed on it.
+###################################
+def generate_done_display(dictionary, weeks, days):
+    (day_starts, buckets) = days
+    for i in done_window_days(weeks, days):
+        display_strings = [menu_highlight("Tasks completed on " +\
+            format_time(day_starts[i], "%a, %d %b %Y")\
+            + "\n"+ESCP)]
+        # Tasks completed at the same time are numbered together.
+        for comp in buckets[i]:
+            count = 1
+            for an_entry in dictionary[comp]:
+                display_strings.append(display_task(an_entry, count)+"\n")
+                count += 1
+        yield "".join(display_strings)
@@ -0,0 +1,493 @@
+#! /usr/bin/python
+
+################################################################################
+#
+# Name:
+#	todo_menu.py
+#
+# Description:
+#	This file contains the menus the user answers when adding, modifying,
+#	finishing or removing a task. They are kept apart from the rest of the
+#	program so only the commands that ask the user anything import them.
+#
+################################################################################
+
+from todo_util import *
+from todo_tasks import *
+import re
+import time
+
+###################################
+# Purpose:
+#       Utility function was created so the same code could be used
+#       for creation of tasks and modification of existing tasks.
+#       This is why when a task is created you see the "Task has no subtasks."
+#       message.
+# Inputs:
+#       dictionary  -   The parent dictionary that is being modified
+#                       (Do I need this? Pass by reference of pass by value?)
+#       entry       -   The Task that is to be modified with a new subtask
+#       subtask_num -   The number of subtasks the task currently has
+# Outputs:
+#       dictionary  -   The dictionary that should now be modified with a new
+#                       subtask in entry
+#       0/1         -   Boolean really showing if the addition was successful
+#                       or not.
+###################################
+def add_subtask(dictionary, entry, subtask_num):
+    # Create message to be shown to the user, then print it
+    message = ""
+    if 0 == subtask_num:
+        message = "Task has no subtasks. "
+    message += "Enter text for new subtask (an identifier will be added by "\
+        +"the program):"
+    program_menu_print(message)
+    # Get users response
+    ui = raw_input()
+    if "" == ui:
+        program_menu_print("No text entered, no subtask created")
+        return (dictionary, 0)
+    # Add the new subtask to the task
+    entry.add_subtask(Subtask(ui))
+    dictionary.touch(entry)
+    return (dictionary, 1)
+
+###################################
+# Purpose:
+#       Allow multiple subtasks to be added to a task at the one time.
+#       (Add subtasks until the user explicitly says no more.)
+# Inputs:
+#       dictionary  -   The dictionary containing the entry
+#       entry       -   The entry we're going to add the subtask to.
+# Outputs:
+#       dictionary  -   The dictionary which should now contain extra subtasks
+#                       in the entry.
+# Comment:
+#       Dictionaries must be pass by reference, look this up.
+###################################
+def add_subtasks_menu(dictionary, entry):
+    condition = True
+    count = 0
+    # Set to true to loop indefinitely
+    while condition:
+        # Call the utility function to actually add the subtask
+        dictionary, success = add_subtask(dictionary, entry, count)
+        count += success # Only increment count when tasks are actually added.
+        # Find out if the user wants to add more tasks
+        program_menu_print("Any more subtasks? [Y/n]")
+        ui = raw_input()
+        if "n" == ui.lower():
+            condition = False
+    # Return the dictionary
+    return dictionary
+
+###################################
+# Purpose:
+#	This function gets the due date for task from the user.
+#
+# Inputs:
+#	N/A everything is picked up from the user inside the function
+#
+# Outputs:
+#	due_date    -	A floating point number representing the due date for
+#			the task.
+###################################
+def get_due_date():
+    today = time.time()
+    today_tuple = time.localtime(today)
+    day = today
+    month = ""
+    year = ""
+    hour = 23
+    minute = 59
+    seconds = 59
+    # Get the day from the user default to today
+
+    msg = "Enter the day of completion: [ Defaults to today: "+\
+	    str(today_tuple[2])+" ]"
+    program_menu_print(msg)
+    ui = raw_input()
+    if "" == ui:
+	day = today_tuple[2]
+    elif int(ui) < 1 or int(ui) > 31:
+	program_menu_print("That is not a real date, using the default")
+	day = today_tuple[2]
+    else:
+	day = int(ui)
+    # Get the month from the user. Default to the current month or if the day is
+    # less than today the next month.
+    default_month = today_tuple[1]
+    if day < today_tuple[2]:
+	default_month += 1
+    if default_month > 12:
+	default_month = 1
+    msg = "Enter the month of completion: "+menu_highlight("1 - 12")+" [Default:"\
+	    +" "+str(default_month)+" ("+ number_to_month(default_month) +") ]"
+    program_menu_print(msg)
+    ui = raw_input()
+    if "" == ui:
+	month = default_month
+    elif int(ui) < 1 or int(ui) > 12:
+	program_menu_print("That is not a real month, using the default")
+	month = default_month
+    else:
+	month = int(ui)
+
+    # Get the year from the user. Default to the current year unless the month
+    # is less than today's month
+    default_year = today_tuple[0]
+    if month < today_tuple[1]:
+	default_year += 1
+    msg = "Enter the year of completion: "+menu_highlight("YYYY format")+\
+	   "[Default: "+str(default_year)+" ]"
+    program_menu_print(msg)
+    ui = raw_input()
+    if "" == ui:
+	year = default_year
+    elif int(ui) < default_year:
+	program_menu_print("I can't let you set a task in the past. Using the \
+		default")
+	year = default_year
+    else:
+	year = int(ui)
+    program_menu_print("Due date for this task is the end of: "+\
+	    menu_highlight(str(day) +" "+ number_to_month(month)+" "+str(year)))
+    new_date = (year, month, day, hour, minute, seconds, -1, -1 ,-1)
+    due_date = time.mktime(new_date)
+    return due_date
+    # Convert the user input to a floating point number representing the date
+    # and return it to the caller.
+
+###################################
+# Purpose:
+#       The menu to display when adding a new task to the todo list
+# Inputs:
+#       N/A
+# Outputs:
+#       line    -   The text for the new task
+#       pri     -   Priority the user wants
+#       lev     -   Level of highlighting the user wants
+#       success -   If the user input was collected correctly
+###################################
+def add_task_menu():
+    # Ask user to enter test and collect it
+    program_menu_print("Enter the text for the new task:")
+    ui = raw_input()
+    if "" == ui:
+        program_menu_print("No input no new task added.")
+        return ("", "", "", "",  0)
+    line = ui
+    program_menu_print("Is there a due date for this task? y/N")
+    ui = raw_input()
+    if "y" == ui.lower():
+	due = get_due_date()
+    else:
+	due = 0
+    # Ask user to enter priority and collect it
+    message = "Enter priority from " + menu_highlight("1") + \
+        " to " + menu_highlight("8") + " (default is 4): "
+    program_menu_print(message)
+    ui = raw_input()
+    try:
+        ui = int(ui)
+        if ui < 1:
+            ui = 1
+        elif ui > 8:
+            ui = 8
+    except ValueError:
+        program_menu_print("Non-interger value entered defaulting to priority"+\
+            "4")
+        ui = 4
+    pri = ui
+
+    # Ask user to enter level of highlighting and collect it
+    message = "Enter highlight level " + menu_highlight("0") + \
+          " (NO HIGHLIGHTING), " + menu_highlight("1") + \
+          " (UNDERLINED), " + menu_highlight("2") + \
+          " (BOLD), " + menu_highlight("3") + \
+          " (INVERSE).\nDefault is 0: "
+    program_menu_print(message)
+    ui = raw_input()
+    try:
+        ui=int(ui)
+        if ui < 1 or ui > 3:
+            ui = 0
+    except ValueError:
+        program_menu_print("Non-integer value entered; defaulting to no"+\
+            "highlighting.")
+        ui = 0
+    lev = ui
+
+    # Return what the user has entered
+    return (line, pri, lev, due, 1)
+
+###################################
+# Purpose:
+#	Print the highlight options menu for the user. A task has already been
+#	chosen at this point.
+# Inputs:
+#	key	-   The priority level of the task that the user wants to
+#		    modify.
+# Outputs:
+#	ui	-   The new level of highlighting the user wants.
+###################################
+def change_highlighting_menu(key):
+    if 0 == key:
+        program_menu_print("Can't change the highlighting of"\
+            "a completed task. Reopen the task by" + \
+            " changing the priority first.")
+        return dictionary
+    message = "Enter highlighting level: "\
+            + menu_highlight("0") + " (REMOVE), "\
+            + menu_highlight("1") + " (UNDERLINED), "\
+            + menu_highlight("2") + " (BOLD), "\
+            + menu_highlight("3") + " (INVERSE)."
+    program_menu_print(message)
+    # Get the user's new highlighting for this entry.
+    ui = raw_input()
+    return ui
+
+###################################
+# Purpose:
+#	Change the highlighting of the given task.
+# Inputs:
+#	dictionary  -	The data structure that contains the task to be
+#			modified.
+#	an_entry    -	The entry who's highlighting is to be changed.
+#	ui	    -	The user defined new highlighting level.
+# Outputs:
+#	dictionary  -	The dictionary with the new highlighting for the task.
+###################################
+def change_highlighting(dictionary, an_entry, ui):
+    # Check the value given by the user makes sense. Report if it is not and
+    # don't use it to change the hiughlighting.
+    try:
+        ui = int(ui)
+        if ui < 0 or ui > 3:
+            raise ValueError
+    except ValueError:
+        program_menu_print("Invalid value, make sure you"\
+            +" use one of the highlighted numbers.\n")
+        return dictionary
+    # Change the highlighting level and return the dictionary.
+    an_entry.lev = ui
+    dictionary.touch(an_entry)
+    return dictionary
+
+###################################
+# Purpose:
+#	Display options to the user and gather user input to change the priority
+#	of a task.
+# Inputs:
+#	key	-   The level that this task is currently at.
+# Outputs:
+#	ui	-   The input obtained from the user.
+###################################
+def change_priority_menu(key):
+    # Display the menu to the user
+    if 0 == key:
+        program_menu_print(INVERSE+"Reopening completed task.")
+    message = "Priority levels range from " + menu_highlight("1") + \
+        " (low) to " + menu_highlight("8") + " (high).\n" + \
+        "Enter new priority for task: "
+    program_menu_print(message)
+    # Get the user's choice and return it to the calling function.
+    ui = raw_input()
+    return ui
+
+
+###################################
+# Purpose:
+#	This is the function that changes the priority of the task.
+# Inputs:
+#	dictionary  -	The dictionary that the task is in
+#	an_entry    -	The task we want to move
+#	ui	    -	Where we want to move the task to
+# Outputs:
+#       Same as the move_entry function (dictionary)
+###################################
+def change_priority(dictionary, an_entry, ui):
+    # Error check the user input value.
+    try:
+        ui = int(ui)
+        if ui < 1 or ui >= 9:
+            raise ValueError
+    except ValueError:
+        program_menu_print("Invalid value, "+ui+" make sure you"\
+            +" use a value in the highlighted range above.\n")
+        return dictionary
+    # Modify the priority level then pass to the move_entry function which
+    # already does what we want.
+    from_pri = an_entry.pri
+    an_entry.pri = ui
+    return move_entry(dictionary, an_entry, from_pri, ui)
+
+###################################
+# Purpose:
+#	Menu and function caller to modify subtasks in a todo list.
+# Inputs:
+#	dictionary  -	The dictionary the task is in
+#	an_entry    -	The entry for which we want to modify subtasks.
+#	key	    -	The level this task is at
+#	number	    -	Where in the task list this task appears
+# Outputs:
+#	dictionary  -	The now modified dictionary
+###################################
+def modify_subtask(dictionary, an_entry, key, number):
+    if 0 == key:
+        program_menu_print("Can't add subtasks to a completed task."\
+            +" Change the priority of the task first.")
+	return dictionary
+    # Pretty print the task we want to modify, the user has had to get through
+    # several layers of menus to get here so they may need reminded of what they
+    # wanted to change.
+    task_string = display_task(an_entry, number)
+    print task_string.encode('UTF-8')
+    # If the task has no subtask we need to add some before we can modify them.
+    if 0 == len(an_entry.sub):
+        dictionary, success = add_subtask(dictionary, an_entry, 0)
+        return dictionary
+    # Print the menu for the user
+    message = "To add a new subtask enter "+ menu_highlight("a") + \
+            "; to complete subtask enter " + menu_highlight("c") + \
+            "; to remove subtask enter " + menu_highlight("r") +\
+            "; enter anything else to cancel"
+    program_menu_print(message)
+    # Get the user input, based on this call different functions.
+    ui = raw_input()
+    # a = add new subtask, find what the next subtask should be and pass it to
+    # the add subtask function
+    if "a" == ui.lower():
+        next = len(an_entry.sub)
+        dictionary, success = add_subtask(dictionary, an_entry, next)
+    # Complete a subtask
+    elif "c" == ui.lower():
+        alpha = "abcdefghijklmnopqrstuvwxyz"
+        program_menu_print("Which subtask has been completed:")
+        i = 0
+	# Print what subtasks exist for the user to choose from
+        while i < len(an_entry.sub)-1:
+            print menu_highlight(alpha[i])+" ",
+            i += 1
+        print menu_highlight(alpha[i])+""+ESCP
+        ui = raw_input()
+        ui.lower()
+	# Need to add error checking for what the user has entered
+	# Find the task the user wanted to complete
+        if "" == ui:
+            program_menu_print("No input, no changes made")
+            return dictionary
+        u = u"\u2714"
+        subtask = an_entry.sub[ord(ui)-97]
+        match = re.search(ur'\u2714', subtask.task)
+	# If this subtask hasn't already been completed add a tick and
+	# completion date to the subtask.
+        if None == match:
+            subtask.task = subtask.task+" "+u
+            subtask.completed = time.time()
+            dictionary.touch(an_entry)
+    # Completely remove a subtask from the list.
+    elif "r" == ui.lower():
+        alpha = "abcdefghijklmnopqrstuvwxyz"
+        program_menu_print("Which subtask is to be removed:")
+        i = 0
+	# Print the subtask choices
+        while i < len(an_entry.sub)-1:
+            print menu_highlight(alpha[i])+" ",
+            i += 1
+        print menu_highlight(alpha[i])+""+ESCP
+        ui = raw_input()
+        ui.lower()
+	# Need to add some error checking here
+        if "" == ui:
+            program_menu_print("No input, no changes made.")
+            return dictionary
+        # Remove the subtask, the ones after it move up a letter.
+        del an_entry.sub[ord(ui)-97]
+        dictionary.touch(an_entry)
+    # Unknown command just exit
+    else:
+        program_menu_print("Unknown command, doing nothing.")
+    return dictionary
+
+###################################
+# Purpose:
+#	Menu and function caller for modifying tasks. The task has already
+#	been found (see resolve_tasks).
+# Inputs:
+#	dictionary  -	The data structure to be modified
+#	key	    -	The priority level the task is in
+#	an_entry    -	The task we want to modify
+#	number	    -	The number the task was displayed with
+#	complete    -	Flag to reduce code duplication, completing a task is
+#			just modifying it so add some extra code instead of
+#			duplicating a large chunk of code.
+# Outputs:
+#	dictionary  -	The newly modified data structure.
+###################################
+def modify_task(dictionary, key, an_entry, number, complete=True):
+    # If completed is true do the required updates else display menus
+    if complete:
+        an_entry.lev = 5
+        an_entry.pri = 0
+        an_entry.completed = time.time()
+        return move_entry(dictionary, an_entry, key, 0)
+    # Menu to display to the user
+    message = "Enter " + menu_highlight("P") + " to change "\
+        + "priority, "+ menu_highlight("H") + " to change "\
+        + "highlighting, or " + menu_highlight("S") + \
+        " to modify subtasks for task " + \
+        menu_highlight(str(number)) + \
+        ". Enter anything else to cancel."
+    program_menu_print(message)
+    # Get user input
+    ui = raw_input()
+    # p means change the priority
+    if "p" == ui.lower():
+        new_pri =  change_priority_menu(key)
+        return change_priority(dictionary, an_entry, new_pri)
+    # h means change the highlighting
+    elif "h" == ui.lower():
+        new_highlight = change_highlighting_menu(key)
+        return change_highlighting(dictionary, an_entry, new_highlight)
+    # s means modify subtasks
+    elif "s" == ui.lower():
+        return modify_subtask(dictionary, an_entry, key, number)
+    # Anything else do nothing
+    else:
+        program_menu_print("Unkown command, doing nothing.")
+    # Return the dictionary
+    return dictionary
+
+###################################
+# Purpose:
+#	Remove tasks that are no longer relevant but have not been completed.
+# Inputs:
+#	dictionary  -	The dictionary that is to be modified
+#	key	    -	The priority level the task is in
+#	an_entry    -	The task to be removed
+#	number	    -	The number the task was displayed with
+# Outputs:
+#	dictionary  -	The newely modified dictionary
+###################################
+def remove_task(dictionary, key, an_entry, number):
+    task_string = display_task(an_entry, number)
+    # Print the task
+    program_menu_print("Task to be removed (there will be no "\
+        +"record of this): ")
+    print task_string.encode('utf-8')
+    # Make sure the user really wants to delete the task, assume
+    # they don't really.
+    program_menu_print("Are you sure you wish to delete this task?"\
+        +" [y/N]:")
+    ui = raw_input()
+    if "y" == ui.lower():
+        # Delete the task
+        dictionary[key].unlink(an_entry)
+        dictionary.forget(an_entry)
+        dictionary.touch(an_entry)
+        program_menu_print("Task deleted.")
+    else:
+        program_menu_print("Task was not deleted.")
+    # Return the dictionary
+    return dictionary
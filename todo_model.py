@@ -0,0 +1,546 @@
+#! /usr/bin/python
+
+################################################################################
+#
+# Name:
+#	todo_model.py
+#
+# Description:
+#	This file contains the objects used to hold tasks and subtasks in
+#	memory. They use __slots__ so that a task costs a small fixed amount of
+#	memory rather than a dictionary each, which matters when the whole done
+#	history is loaded.
+#
+################################################################################
+
+import collections
+import heapq
+
+# Shared by every task that has no subtasks, replaced with a list of its own
+# when the first subtask is added.
+NO_SUBTASKS = ()
+
+###################################
+# Purpose:
+#	A subtask of a task, shown under the task with a letter identifier.
+# Fields:
+#	task	    -	The text of the subtask
+#	completed   -	When the subtask was completed in seconds since the
+#			epoch, None if it hasn't been.
+###################################
+class Subtask(object):
+    __slots__ = ("task", "completed")
+
+    def __init__(self, task, completed=None):
+        self.task = task
+        self.completed = completed
+
+###################################
+# Purpose:
+#	A single task in the todo list or the done list.
+# Fields:
+#	line	    -	The text of the task
+#	pri	    -	Priority of the task, 0 (completed) to 8
+#	lev	    -	Level of highlighting for the task
+#	completed   -	When the task was completed in seconds since the
+#			epoch, None if it hasn't been.
+#	add	    -	When the task was added, None if not known.
+#	due	    -	When the task is due, None if it has no due date.
+#	sub	    -	The subtasks of this task, in order.
+#	id	    -	Short identifier that stays with the task for good,
+#			unlike its number in the list.
+#	slot	    -	Where the task is held in its priority Bucket, None
+#			when it isn't in one.
+###################################
+class Task(object):
+    __slots__ = ("line", "pri", "lev", "completed", "add", "due", "sub",\
+        "id", "slot")
+
+    def __init__(self, line, pri=4, lev=0, completed=None, add=None,\
+            due=None, id=None):
+        self.line = line
+        self.pri = pri
+        self.lev = lev
+        self.completed = completed
+        self.add = add
+        self.due = due
+        self.sub = NO_SUBTASKS
+        self.id = id
+        self.slot = None
+
+    ###################################
+    # Purpose:
+    #	Add a subtask to the end of this task's subtasks.
+    # Inputs:
+    #	subtask	    -	The Subtask to add
+    # Outputs:
+    #	N/A
+    ###################################
+    def add_subtask(self, subtask):
+        if NO_SUBTASKS is self.sub:
+            self.sub = [subtask]
+        else:
+            self.sub.append(subtask)
+
+# A bucket is only compacted once it has at least this many removed tasks
+# and they outnumber the tasks still in it.
+COMPACT_MINIMUM = 32
+
+###################################
+# Purpose:
+#	The tasks at one priority level, in the order they are displayed.
+#	Tasks are added to the end and can be removed from anywhere without
+#	moving the tasks after them; the gap is left empty and the bucket is
+#	compacted once the gaps outnumber the tasks.
+#	A Fenwick tree over the slots counts the tasks still in the bucket so
+#	the nth task, and the position of a task, can be found in O(log n)
+#	rather than by counting through the bucket.
+# Fields:
+#	tasks	    -	The tasks in display order, None where one was removed
+#	dead	    -	How many None entries there are in tasks
+#	tree	    -	Fenwick tree of the number of tasks in each slot,
+#			indexed from one.
+###################################
+class Bucket(object):
+    __slots__ = ("tasks", "dead", "tree")
+
+    def __init__(self):
+        self.tasks = []
+        self.dead = 0
+        self.tree = [0]
+
+    def __len__(self):
+        return len(self.tasks) - self.dead
+
+    def __iter__(self):
+        for task in self.tasks:
+            if None != task:
+                yield task
+
+    ###################################
+    # Purpose:
+    #	Add a task to the end of the bucket.
+    # Inputs:
+    #	task	    -	The Task to add
+    # Outputs:
+    #	N/A
+    ###################################
+    def append(self, task):
+        task.slot = len(self.tasks)
+        self.tasks.append(task)
+        # The new node covers the slots (i - lowbit(i), i], all of them are
+        # already in the tree apart from the new one.
+        i = len(self.tasks)
+        self.tree.append(1 + self.count(i - 1) - self.count(i - (i & -i)))
+
+    ###################################
+    # Purpose:
+    #	Put a task in the place of one already in the bucket.
+    # Inputs:
+    #	old	    -	The Task to replace, it must be in this bucket.
+    #	new	    -	The Task to put in its place
+    # Outputs:
+    #	N/A
+    ###################################
+    def replace(self, old, new):
+        new.slot = old.slot
+        self.tasks[new.slot] = new
+        old.slot = None
+
+    ###################################
+    # Purpose:
+    #	Remove a task from the bucket, the order of the remaining tasks is
+    #	unchanged.
+    # Inputs:
+    #	task	    -	The Task to remove, it must be in this bucket.
+    # Outputs:
+    #	N/A
+    ###################################
+    def unlink(self, task):
+        self.tasks[task.slot] = None
+        i = task.slot + 1
+        size = len(self.tasks)
+        while i <= size:
+            self.tree[i] -= 1
+            i += i & -i
+        task.slot = None
+        self.dead += 1
+        if self.dead >= COMPACT_MINIMUM and self.dead * 2 > len(self.tasks):
+            self.compact()
+
+    ###################################
+    # Purpose:
+    #	Close up the gaps left by removed tasks and rebuild the tree.
+    # Inputs:
+    #	N/A
+    # Outputs:
+    #	N/A
+    ###################################
+    def compact(self):
+        self.tasks = [task for task in self.tasks if None != task]
+        for (slot, task) in enumerate(self.tasks):
+            task.slot = slot
+        self.dead = 0
+        self.rebuild()
+
+    ###################################
+    # Purpose:
+    #	Build the tree from scratch for the slots as they are, in O(n).
+    # Inputs:
+    #	N/A
+    # Outputs:
+    #	N/A
+    ###################################
+    def rebuild(self):
+        size = len(self.tasks)
+        tree = [0] + [int(None != task) for task in self.tasks]
+        for i in xrange(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    ###################################
+    # Purpose:
+    #	Add a number of tasks to the end of the bucket at once, the tree is
+    #	built once for all of them.
+    # Inputs:
+    #	tasks	    -	The Tasks to add, in order
+    # Outputs:
+    #	N/A
+    ###################################
+    def extend(self, tasks):
+        for task in tasks:
+            task.slot = len(self.tasks)
+            self.tasks.append(task)
+        self.rebuild()
+
+    ###################################
+    # Purpose:
+    #	Remove a number of tasks from the bucket at once, closing up the gaps
+    #	and building the tree once for all of them.
+    # Inputs:
+    #	tasks	    -	The Tasks to remove, they must be in this bucket.
+    # Outputs:
+    #	N/A
+    ###################################
+    def remove(self, tasks):
+        for task in tasks:
+            self.tasks[task.slot] = None
+            task.slot = None
+        self.compact()
+
+    ###################################
+    # Purpose:
+    #	Count the tasks in the first slots of the bucket.
+    # Inputs:
+    #	slots	    -	How many slots to count over
+    # Outputs:
+    #	total	    -	The number of tasks in those slots
+    ###################################
+    def count(self, slots):
+        total = 0
+        while slots > 0:
+            total += self.tree[slots]
+            slots -= slots & -slots
+        return total
+
+    ###################################
+    # Purpose:
+    #	Find the nth task in the bucket.
+    # Inputs:
+    #	number	    -	Position of the task, counting from one
+    # Outputs:
+    #	The Task at that position, None if there aren't that many tasks.
+    ###################################
+    def nth(self, number):
+        if number < 1 or number > len(self):
+            return None
+        size = len(self.tasks)
+        step = 1
+        while step * 2 <= size:
+            step *= 2
+        # Walk down the tree finding the last slot with fewer than number
+        # tasks before it.
+        slot = 0
+        while step > 0:
+            if slot + step <= size and self.tree[slot + step] < number:
+                slot += step
+                number -= self.tree[slot]
+            step /= 2
+        return self.tasks[slot]
+
+    ###################################
+    # Purpose:
+    #	Find the position of a task in the bucket.
+    # Inputs:
+    #	task	    -	The Task, it must be in this bucket.
+    # Outputs:
+    #	Position of the task, counting from one
+    ###################################
+    def position(self, task):
+        return self.count(task.slot + 1)
+
+###################################
+# Purpose:
+#	The todo list, a dictionary of priority level to the Bucket of tasks
+#	at that level. Alongside it is an index from each task's id to the
+#	task so a task can be found by id without searching. The list also
+#	keeps track of which tasks have been changed since it was loaded, so
+#	it is only written back when it has and only the changes need to be
+#	journalled.
+# Fields:
+#	ids	    -	Dictionary of task id to Task
+#	dirty	    -	True if the list has changed since it was loaded
+#	changed	    -	Ordered dictionary of the id of each changed task to
+#			(Task, moved), moved is True if the task was added
+#			to the end of a bucket. Tasks are in the order they
+#			were last moved.
+#	journal	    -	The number of records in the journal the list was
+#			loaded with.
+#	ordered	    -	True if the tasks in the file the list was loaded
+#			from are in the order they are displayed, as they
+#			are when the list is written.
+#	version	    -	The file keys of the todo file and its journal when
+#			the list was loaded, used to notice another run of
+#			the program saving the list in the meantime.
+#	dues	    -	Heap of (due, id) of the open tasks with a due date,
+#			None until it is needed and whenever the list changes.
+###################################
+class TaskList(dict):
+
+    def __init__(self):
+        dict.__init__(self, [(pri, Bucket()) for pri in range(9)])
+        self.ids = {}
+        self.dirty = False
+        self.changed = collections.OrderedDict()
+        self.journal = 0
+        self.ordered = False
+        self.version = None
+        self.dues = None
+
+    ###################################
+    # Purpose:
+    #	Record that a task in the list has been changed, added or removed.
+    # Inputs:
+    #	task	    -	The Task that changed
+    #	moved	    -	True if the task has been added to the end of a
+    #			bucket, either new or from another bucket.
+    # Outputs:
+    #	N/A
+    ###################################
+    def touch(self, task, moved=False):
+        self.dirty = True
+        self.dues = None
+        # Only a move changes where the task is replayed from the journal.
+        if task.id in self.changed:
+            (previous, was_moved) = self.changed[task.id]
+            if moved:
+                del self.changed[task.id]
+            moved = moved or was_moved
+        self.changed[task.id] = (task, moved)
+
+    ###################################
+    # Purpose:
+    #	Record that the list has been written out, nothing has changed since.
+    # Inputs:
+    #	N/A
+    # Outputs:
+    #	N/A
+    ###################################
+    def saved(self):
+        self.dirty = False
+        self.changed.clear()
+
+    ###################################
+    # Purpose:
+    #	Add a task to the id index, giving it a new id if it doesn't have
+    #	one or its id is already taken. A task read from the file without
+    #	an id, one added by hand, gets an id made from its text, so every
+    #	run that reads the file before it is saved gives it the same id and
+    #	their saves can be merged without adding the task twice.
+    # Inputs:
+    #	task	    -	The Task to add to the index
+    #	derived	    -	True to make the id from the task's text rather
+    #			than at random.
+    # Outputs:
+    #	N/A
+    ###################################
+    def register(self, task, derived=False):
+        attempt = 0
+        while None == task.id or task.id in self.ids:
+            if derived:
+                import hashlib
+                task_id = hashlib.sha1(task.line.encode("utf-8")+"\n"\
+                    +str(attempt)).hexdigest()[:6]
+                attempt += 1
+            else:
+                import random
+                task_id = "%06x" % random.getrandbits(24)
+            # An id that is all digits would be taken for a task number.
+            if task_id.isdigit():
+                continue
+            task.id = task_id
+            # The new id needs to be written to the file.
+            self.touch(task)
+        self.ids[task.id] = task
+
+    ###################################
+    # Purpose:
+    #	Remove a task from the id index.
+    # Inputs:
+    #	task	    -	The Task to remove from the index
+    # Outputs:
+    #	N/A
+    ###################################
+    def forget(self, task):
+        if self.ids.get(task.id) is task:
+            del self.ids[task.id]
+
+    ###################################
+    # Purpose:
+    #	Get the heap of due dates of the open tasks, building it if the list
+    #	has changed since it was last built.
+    # Inputs:
+    #	N/A
+    # Outputs:
+    #	Heap (a list ordered by heapq) of (due, id)
+    ###################################
+    def due_heap(self):
+        if None == self.dues:
+            self.dues = [(task.due, task.id) for (key, bucket) in self.items()\
+                if key > 0 for task in bucket if None != task.due]
+            heapq.heapify(self.dues)
+        return self.dues
+
+###################################
+# Purpose:
+#	Find the open tasks due soonest, in the order they are due. The heap of
+#	due dates is walked rather than sorted or emptied: only the entries
+#	below ones already taken are looked at, so finding k tasks costs
+#	O(k log k) once the heap is built.
+# Inputs:
+#	dictionary  -	The todo list
+#	count	    -	The most tasks to find, None for no limit
+#	before	    -	Only find tasks due at or before this time, None for
+#			no limit.
+# Outputs:
+#	List of the Tasks
+###################################
+def due_soonest(dictionary, count=None, before=None):
+    heap = dictionary.due_heap()
+    tasks = []
+    frontier = []
+    if [] != heap:
+        frontier = [(heap[0], 0)]
+    while [] != frontier and (None == count or len(tasks) < count):
+        ((due, task_id), i) = heapq.heappop(frontier)
+        if None != before and due > before:
+            break
+        tasks.append(dictionary.ids[task_id])
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+    return tasks
+
+###################################
+# Purpose:
+#	Create an empty todo list, one bucket for each priority level.
+# Inputs:
+#	N/A
+# Outputs:
+#	dictionary  -	TaskList {<priority-level (0 - 8)>: Bucket}
+###################################
+def new_todo_dict():
+    return TaskList()
+
+###################################
+# Purpose:
+#	Find a task by the number it is displayed with. Tasks are numbered from
+#	the highest priority down so whole buckets are skipped by their size
+#	and the task is found in its bucket through the bucket's tree.
+# Inputs:
+#	dictionary  -	The todo list
+#	number	    -	The number the task is displayed with
+# Outputs:
+#	key	    -	The priority level the task is in, None if not found
+#	an_entry    -	The Task, None if not found
+###################################
+def find_task(dictionary, number):
+    keys = dictionary.keys()
+    keys.sort(reverse=True)
+    for key in keys:
+        size = len(dictionary[key])
+        if number <= size:
+            an_entry = dictionary[key].nth(number)
+            if None == an_entry:
+                break
+            return (key, an_entry)
+        number -= size
+    return (None, None)
+
+###################################
+# Purpose:
+#	Find a task either by the number it is displayed with or by its id.
+#	Ids are looked up in the id index of the list. A string is taken as an
+#	id if a task has it, otherwise as a number if it is all digits, so
+#	tasks given all digit ids before ids always had a letter can still be
+#	found by them.
+# Inputs:
+#	dictionary  -	The todo list
+#	reference   -	The number the task is displayed with (an int) or the
+#			task's id or number as given on the command line (a
+#			string)
+# Outputs:
+#	key	    -	The priority level the task is in, None if not found
+#	an_entry    -	The Task, None if not found
+###################################
+def resolve_task(dictionary, reference):
+    if isinstance(reference, (int, long)):
+        return find_task(dictionary, reference)
+    an_entry = dictionary.ids.get(reference)
+    if None != an_entry:
+        return (an_entry.pri, an_entry)
+    if reference.isdigit():
+        return find_task(dictionary, int(reference))
+    return (None, None)
+
+###################################
+# Purpose:
+#	Find several tasks at once. Every task is found before any of them
+#	are changed, so numbers all refer to the list as it was displayed.
+# Inputs:
+#	dictionary  -	The todo list
+#	references  -	List of numbers and ids, as for resolve_task
+# Outputs:
+#	List of (key, an_entry, number) for each task found, in the order
+#	given. Tasks that aren't found are left out, as are tasks given more
+#	than once after the first time.
+###################################
+def resolve_tasks(dictionary, references):
+    tasks = []
+    found = set()
+    for reference in references:
+        (key, an_entry) = resolve_task(dictionary, reference)
+        if None == an_entry or id(an_entry) in found:
+            continue
+        found.add(id(an_entry))
+        tasks.append((key, an_entry, task_number(dictionary, key, an_entry)))
+    return tasks
+
+###################################
+# Purpose:
+#	Work out the number a task is displayed with.
+# Inputs:
+#	dictionary  -	The todo list
+#	key	    -	The priority level the task is in
+#	an_entry    -	The Task
+# Outputs:
+#	The number the task is displayed with
+###################################
+def task_number(dictionary, key, an_entry):
+    number = 0
+    for pri in dictionary:
+        if pri > key:
+            number += len(dictionary[pri])
+    return number + dictionary[key].position(an_entry)
@@ -0,0 +1,251 @@
+#! /usr/bin/python
+
+################################################################################
+#
+# Name:
+#	todo_summary.py
+#
+# Description:
+#	This file contains todo.py --summary, the number of open tasks at each
+#	priority and how many are overdue, for use in a shell prompt. The
+#	counts are kept in a small sidecar beside the todo file,
+#	~/tasks/.todo.summary, written each time the list is saved. When the
+#	file has been changed some other way the sidecar is rebuilt by reading
+#	just the priority and due date flags from the file, without building
+#	the todo list. Like todo_client.py it only needs the standard library
+#	so a prompt doesn't pay for loading the rest of the program.
+#
+################################################################################
+
+import os
+import re
+import time
+import bisect
+import marshal
+
+# Changes whenever what is kept in the sidecar changes.
+SUMMARY_VERSION = 1
+
+# The flags the summary needs, written as in FLAGS in todo_util.py, and the
+# regexes parse_todo_lines uses to tell which lines are tasks.
+PRI_REGEX = re.compile(r"--pri=(-?\d+)")
+DUE_REGEX = re.compile(r"--due=(\d+\.\d+)")
+LETTER_REGEX = re.compile("[a-zA-Z]")
+SUMMARY_SUBTASK_REGEX = re.compile("^\s+[a-zA-Z]+\)")
+
+###################################
+# Purpose:
+#	Get the name of the summary sidecar of a todo file, named as
+#	sidecar_name in todo_util.py names them.
+# Inputs:
+#	file_name   -	The name of the todo file
+# Outputs:
+#	The name of the sidecar, e.g. ~/tasks/.todo.summary
+###################################
+def summary_name(file_name):
+    directory, base = os.path.split(file_name)
+    return os.path.join(directory, "."+base+".summary")
+
+###################################
+# Purpose:
+#	Work out the key of the todo file and its journal as they are now, any
+#	change to either changes the key.
+# Inputs:
+#	file_name   -	The name of the todo file
+# Outputs:
+#	Tuple of (inode, size, modification time) of the todo file and of the
+#	journal, None for a file that doesn't exist.
+###################################
+def summary_key(file_name):
+    key = []
+    for name in (file_name, file_name+".journal"):
+        try:
+            stat = os.stat(name)
+            key.append((stat.st_ino, stat.st_size, stat.st_mtime))
+        except OSError:
+            key.append(None)
+    return tuple(key)
+
+###################################
+# Purpose:
+#	Count the open tasks of a todo list.
+# Inputs:
+#	dictionary  -	The todo list
+# Outputs:
+#	counts	    -	Dictionary of priority to the number of open tasks
+#	dues	    -	Sorted list of the due dates of the open tasks
+###################################
+def summarise_tasks(dictionary):
+    counts = {}
+    dues = []
+    for (pri, bucket) in dictionary.items():
+        if pri > 0 and len(bucket) > 0:
+            counts[pri] = len(bucket)
+            dues.extend([task.due for task in bucket if None != task.due])
+    dues.sort()
+    return (counts, dues)
+
+###################################
+# Purpose:
+#	Count the open tasks of a todo file by reading only their priority and
+#	due date, the same way parse_todo_lines reads them. Subtasks and the
+#	rest of each line are skipped, and a regex is only run on a line once
+#	a plain search has found what it looks for.
+# Inputs:
+#	file_name   -	The name of the todo file
+# Outputs:
+#	The same as summarise_tasks
+###################################
+def scan_summary(file_name):
+    counts = {}
+    dues = []
+    file_handle = open(file_name, "rb")
+    try:
+        for line in file_handle:
+            if line[:1] in " \t" and SUMMARY_SUBTASK_REGEX.match(line):
+                continue
+            # Comments are removed as they are when the file is parsed.
+            if "#" in line:
+                line = line[:line.index("#")]
+            # Priority defaults to 4, a line without a letter isn't a task.
+            match = None
+            if "--pri=" in line:
+                match = PRI_REGEX.search(line)
+            elif None == LETTER_REGEX.search(line):
+                continue
+            pri = 4
+            if None != match:
+                pri = int(match.group(1))
+            if pri > 0:
+                counts[pri] = counts.get(pri, 0) + 1
+                if "--due=" in line:
+                    match = DUE_REGEX.search(line)
+                    if None != match:
+                        dues.append(float(match.group(1)))
+    finally:
+        file_handle.close()
+    dues.sort()
+    return (counts, dues)
+
+###################################
+# Purpose:
+#	Store the summary of a todo file in its sidecar. The sidecar is
+#	written to a temporary file and moved into place so a half written
+#	sidecar is never read.
+# Inputs:
+#	file_name   -	The name of the todo file
+#	key	    -	The summary_key of the files the summary was made from
+#	summary	    -	(counts, dues) as from summarise_tasks
+# Outputs:
+#	N/A
+###################################
+def save_summary(file_name, key, summary):
+    name = summary_name(file_name)
+    temp_name = name+"."+str(os.getpid())
+    try:
+        file_handle = open(temp_name, "wb")
+        try:
+            marshal.dump((SUMMARY_VERSION, key) + summary, file_handle)
+        finally:
+            file_handle.close()
+        os.rename(temp_name, name)
+    # The summary is only an optimisation, failing to write it is not an
+    # error.
+    except Exception:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+
+###################################
+# Purpose:
+#	Get the summary of a todo file from its sidecar.
+# Inputs:
+#	file_name   -	The name of the todo file
+#	key	    -	The summary_key of the files as they are now
+# Outputs:
+#	(counts, dues) as from summarise_tasks, None if the sidecar is missing
+#	or was made from different files.
+###################################
+def load_summary(file_name, key):
+    try:
+        file_handle = open(summary_name(file_name), "rb")
+        try:
+            stored = marshal.load(file_handle)
+        finally:
+            file_handle.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if SUMMARY_VERSION != stored[0] or key != stored[1]:
+        return None
+    return stored[2:]
+
+###################################
+# Purpose:
+#	Get the summary of a todo file, rebuilding the sidecar if it is out of
+#	date. The file alone can be scanned, but the changes in a journal can
+#	only be had by loading the list.
+# Inputs:
+#	file_name   -	The name of the todo file
+# Outputs:
+#	(counts, dues) as from summarise_tasks
+###################################
+def todo_summary(file_name):
+    key = summary_key(file_name)
+    # With no todo file there are no tasks.
+    if None == key[0]:
+        return ({}, [])
+    summary = load_summary(file_name, key)
+    if None != summary:
+        return summary
+    if None == key[1]:
+        summary = scan_summary(file_name)
+    else:
+        from todo_tasks import generate_todo_dict
+        summary = summarise_tasks(generate_todo_dict(file_name))
+    save_summary(file_name, key, summary)
+    return summary
+
+###################################
+# Purpose:
+#	Print the summary of a todo file.
+# Inputs:
+#	file_name   -	The name of the todo file
+#	output	    -	"text" or "jsonl", as --format
+# Outputs:
+#	N/A
+###################################
+def print_summary(file_name, output):
+    (counts, dues) = todo_summary(file_name)
+    overdue = bisect.bisect_right(dues, time.time())
+    total = sum(counts.values())
+    if "jsonl" == output:
+        import json
+        print json.dumps({"open": total, "overdue": overdue,\
+            "priorities": dict([(str(pri), counts[pri]) for pri in counts])},\
+            sort_keys=True)
+        return
+    priorities = "".join([" P"+str(pri)+":"+str(counts[pri])\
+        for pri in sorted(counts, reverse=True)])
+    print str(total)+" open"+priorities+", "+str(overdue)+" overdue"
+
+###################################
+# Purpose:
+#	Run todo.py --summary straight from todo.py, without the command line
+#	parser or the daemon, when no other options are given.
+# Inputs:
+#	argv	    -	The command line arguments, without the program name
+# Outputs:
+#	The exit status, None if there are other options and the command has
+#	to be run as any other.
+###################################
+def summary_command(argv):
+    if ["--summary"] == argv:
+        output = "text"
+    elif argv in (["--summary", "--format", "jsonl"],\
+            ["--summary", "--format=jsonl"]):
+        output = "jsonl"
+    else:
+        return None
+    print_summary(os.getenv("HOME")+"/tasks/todo", output)
+    return 0
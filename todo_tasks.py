@@ -12,15 +12,24 @@
 #
 ################################################################################
 from todo_util import *
+from todo_summary import *
 import re
 import time
 
+# Small changes to the todo list are appended to a journal rather than
+# rewriting the whole file. The journal is folded back into the file once it
+# holds too many records or gets too large, or when a lot of the list changes
+# at once.
+JOURNAL_MAX_RECORDS = 200
+JOURNAL_MAX_BYTES = 65536
+JOURNAL_MAX_CHANGES = 20
+
 ###################################
 # Purpose:
 #	This function converts a file containg a predefined format into an
-#	internal format used through out the program. The main data strucutres
-#	are dictionaries. It is entirly possible that this project could also be
-#	completed with objects.
+#	internal format used through out the program. Tasks are held in Task
+#	objects (see todo_model.py) that are grouped by priority in
+#	dictionaries.
 #
 # Inputs:
 #	file_name   -	The name of the file that contains the task list
@@ -29,519 +38,541 @@ import time
 #	dictionary  -	The internal representation that is used through out the
 #			program. This format is as follows.
 # { <priority-level (0 - 8):
-#   { <task-number>:{
-#	    "line":<text>
-#	    "pri":<number>
-#	    "lev":<number>
-#	    "sub":{} or {
-#		    <subtask-number>:{
-#			    "task":<text>
-#			    ?"completed":<number>?}
-#	    }
-#	    ?"completed":<number>?
-#	}
-#	(More tasks at this priority)
-#    }
+#   Bucket[ Task(line, pri, lev, completed, add, due,
+#		 sub=[Subtask(task, completed), ...])
+#	(More tasks at this priority, in display order)
+#    ]
 #   (The rest of the priority levels)
 # }
 #
 ###################################
 def generate_todo_dict (file_name):
-    #read file
-    contents = read_file(file_name)
-    dictionary = {0 : {}, 1 : {}, 2 : {}, 3 : {}, 4 : {}, 5 : {}, 6 : {}, 7 : {},\
-        8 : {}}
+    # Load the file, only parsing it if the snapshot is out of date, then
+    # apply any changes recorded in the journal since it was written.
+    # The version is taken before loading, should the files change while
+    # they are loaded it is older than the list and a save will notice.
+    version = todo_version(file_name)
+    dictionary = load_parsed(file_name, parse_todo_lines)
+    dictionary.version = version
+    dictionary.dues = None
+    # Ids given to tasks while loading have to be written to the file itself
+    # before the journal can refer to them, so the next save compacts.
+    if dictionary.dirty:
+        dictionary.journal = JOURNAL_MAX_RECORDS
+    return replay_journal(dictionary, file_name)
+
+###################################
+# Purpose:
+#	Build the internal format described above from the lines of the todo
+#	file.
+# Inputs:
+#	contents    -	The lines of the todo file
+# Outputs:
+#	dictionary  -	The internal representation of the todo list
+###################################
+def parse_todo_lines(contents):
+    dictionary = new_todo_dict()
 
     # Set up the conditions for the while loop
     l = len(contents)
     count = 0
+    # The file is in display order if no task has a higher priority than the
+    # one before it.
+    dictionary.ordered = True
+    last_pri = None
     while count < l:
-	# Find the line, clean it up and remove any non letters from the front.
+        # Find the line, clean it up and remove any non letters from the front.
         line = contents[count]
-        line = re.sub("#.*$", "", line) # Remove comments from the file
+        line = COMMENT_REGEX.sub("", line) # Remove comments from the file
         line = line[:-1]
-        line = re.sub("^[^a-zA-Z]+", "", line)
+        line = TASK_PREFIX_REGEX.sub("", line)
         # If there's anything left of the line process it.
-	if line != "":
-	    # Match the task's priority and add it to the dictionary,
-	    # default to 4
-	    match = re.search("--pri=((-)?\d+)", line)
-	    if match != None:
-		pri = match.group(1)
-	    else:
-		pri = 4
-	    # Match the task's level of highlighting and add it to the
-	    # dictionary, default to 4.
-	    match = re.search("--lev=(\d+)", line)
-	    if match != None:
-		lev = match.group(1)
-	    else:
-		lev = 0
-	    # If the task has been completed the --comp flag will exist, match
-	    # it and add it to the dictionary.
-	    match = re.search("--comp=(\d+\.\d+)", line)
-	    if None != match:
-		comp = match.group(1)
-	    else:
-		comp = 0
-	    # Get the date a task was added if it exists
-	    match = re.search("--add=(\d+\.\d+)", line)
-	    if None != match:
-		add = match.group(1)
-	    else:
-		add = 0
-	    # Get the due date of the task if it exists
-	    match = re.search("--due=(\d+\.\d+)", line)
-	    if None != match:
-		due = match.group(1)
-	    else:
-		due = 0
-	    # Get rid of the stored metadata of the file
-	    sanitize = strip_internal_format(line)
-	    # Create a new entry in the dictionary at the right priority level.
-	    entry = dictionary[int(pri)]
-	    keys = entry.keys()
-	    # Find out if there are any exisiting tasks at this priortiy level.
-	    # Assign the task number that this task will use.
-            if [] != keys:
-                highest = keys[-1]
-                next = highest + 1
-            else:
-                next = 0
-	    # Add the info to the entry
-            entry[next] = {"line" : sanitize, "pri" : pri, "lev" : lev,\
-                "sub" : {}}
-            if comp > 0:
-                entry[next]["completed"] = comp
-	    if add > 0:
-		entry[next]["add"] = add
-	    if due > 0:
-		entry[next]["due"] = due
+        if line != "":
+            # Split the line into the task text and its metadata. Priority
+            # defaults to 4, level of highlighting to 0. Completion, added
+            # and due dates may not exist.
+            sanitize, flags = tokenize_line(line)
+            pri = flags.get("pri", 4)
+            if None != last_pri and pri > last_pri:
+                dictionary.ordered = False
+            last_pri = pri
+            # Add a new entry to the end of the right priority level.
+            entry = Task(sanitize, pri, flags.get("lev", 0),\
+                flags.get("comp"), flags.get("add"), flags.get("due"),\
+                flags.get("id"))
+            dictionary[pri].append(entry)
+            # Add the task to the id index, tasks without an id get one.
+            dictionary.register(entry, True)
             # Check for sublevels
-	    count = check_for_sublevels(entry[next], count, contents)
+            count = check_for_sublevels(entry, count, contents)
         # Increment the count.
-	count += 1
+        count += 1
     # Return the dictionary.
     return dictionary
 
 ###################################
 # Purpose:
-#	This function takes a dictionary and returns it to a formatted stirng to
-#	be printed to a file.
+#	This function turns a dictionary into the formatted lines to be
+#	written to a file. The lines for each task are produced one task at a
+#	time so they can be written out as they are made.
 # Inputs:
 #	dictionary  -	The too task list that is to be written to a file.
 # Outputs:
-#	file_string	-   The string that can then be written to a file.
+#	task_string	-   Generates the lines for each task in turn.
 ###################################
-def generate_todo_string(dictionary):
+def generate_todo_lines(dictionary):
     # Set up variables for looping over.
     keys = dictionary.keys()
     keys.sort(reverse=True)
     task_number = 1
-    file_string = ""
     for key in keys:
-	# Get each priority level.
-        priority_level = dictionary[key]
-        entries = priority_level.keys()
-	# Loop through each priority level, using the keys.
-        for entry in entries:
-	    # Grab each value for the key
-            an_entry = priority_level[entry]
-
-	    # Add the line and the metadata to a string.
-            task_string = str(task_number)+") "+an_entry["line"]
-            if "pri" in an_entry:
-                task_string += " --pri="+str(an_entry["pri"])
-            if "lev" in an_entry:
-                task_string += " --lev="+str(an_entry["lev"])
-            if "completed" in an_entry:
-                task_string += " --comp="+str(an_entry["completed"])
-	    if "add" in an_entry:
-		task_string += " --add="+str(an_entry["add"])
-	    if "due" in an_entry:
-		task_string += " --due="+str(an_entry["due"])
-            task_string += "\n"
-	    # Add the substring to the string.
-	    # This if statement can be put in a function and reused
-            if an_entry["sub"] != {}:
-                sublevels = an_entry["sub"]
-                alpha = "abcdefghijklmnopqrstuvwxyz"
-                subkeys = sublevels.keys()
-                for key in subkeys:
-                    task_string += "\t"+alpha[key]+") "+sublevels[key]["task"]
-                    if "completed" in sublevels[key]:
-                        task_string += " --comp="+str(sublevels[key]\
-                            ["completed"])
-                    task_string+="\n"
-	    # Add the task to the whole file string.
-            file_string += task_string
+        # Loop through each task in the priority level.
+        for an_entry in dictionary[key]:
+            yield generate_task_string(an_entry, task_number)
             task_number += 1
-    # Return the file string.
-    return file_string
 
+###################################
+# Purpose:
+#	Build the lines of the todo file for a single task.
+# Inputs:
+#	an_entry    -	The task to convert
+#	task_number -	The number to give the task
+# Outputs:
+#	task_string -	The line for the task followed by its subtasks.
+###################################
+def generate_task_string(an_entry, task_number):
+    # Add the line and the metadata to a string.
+    task_string = str(task_number)+") "+an_entry.line
+    task_string += " --pri="+str(an_entry.pri)
+    task_string += " --lev="+str(an_entry.lev)
+    if None != an_entry.completed:
+        task_string += " --comp="+repr(an_entry.completed)
+    if None != an_entry.add:
+        task_string += " --add="+repr(an_entry.add)
+    if None != an_entry.due:
+        task_string += " --due="+repr(an_entry.due)
+    task_string += " --id="+an_entry.id
+    task_string += "\n"
+    # Add the subtasks to the string.
+    task_string += generate_subtask_string(an_entry)
+    return task_string
 
 ###################################
 # Purpose:
-#	Move a task from one priority to another, useful when completing a task
-#	and when reducing or increasing the priority of a task.
-#
+#	Get the name of the journal kept for the todo file.
 # Inputs:
-#	dictionary	-   The data structure containing the item to be
-#			    moved.
-#	an_entry	-   The task that is to be moved.
-#	from_pri	-   The priority that the task is currently in.
-#	to_pri		-   The priority the task is being moved to.
-#	item_number	-   The position the task is at in it's current prioirty
-#			    level
+#	file_name   -	The name of the todo file
 # Outputs:
-#	dictionary	-   The rearanged dictionary with the prioirties sorted
-#			    out.
+#	The name of the journal, e.g. ~/tasks/todo.journal
 ###################################
-def move_entry(dictionary, an_entry, from_pri, to_pri, item_number):
-    # This is terrible form but, why have I done this if statement?
-    # I remember now, level zero elements have highlights that are strike
-    # through, to reopen the task we need to get rid of this highlighting.
-    # And things like this are the reason why we comment as we code kids.
-    if from_pri == 0:
-        an_entry["lev"] = 0
-    # Get all the task in the priority level
-    items = dictionary[from_pri].keys()
+def journal_name(file_name):
+    return file_name+".journal"
+
+###################################
+# Purpose:
+#	Get the version of the todo list on disk, the identity of the todo file
+#	and of its journal. Every save changes one or the other.
+# Inputs:
+#	file_name   -	The name of the todo file
+# Outputs:
+#	(file_key of the todo file, file_key of the journal)
+###################################
+def todo_version(file_name):
+    return (file_key(file_name), file_key(journal_name(file_name)))
 
-    # Loop from the task we are moving to the end of the tasks
-    while item_number < len(items)-1:
-	# Set item N to be the same as N + 1, getting rid of the element that we
-	# are moving.
-        dictionary[from_pri][item_number] = dictionary[from_pri][item_number+1]
-        item_number += 1
-    # The last item will be repeated so delete this last item.
-    del dictionary[from_pri][item_number]
-    new_lev = dictionary[to_pri]
-    key_list = new_lev.keys()
-    # Find what the new task number is for this element. Either the first
-    # element in the level or the highest + 1
-    if [] != key_list:
-        highest = key_list[-1]
-        next = highest + 1
-    else:
-        next = 0
-    # Move the entry to it's new priority level and task number
-    dictionary[to_pri][next] = an_entry
+###################################
+# Purpose:
+#	Load only the first tasks of the todo list, stopping reading the file
+#	once enough have been found. This is only possible when the file is
+#	known to be in display order: it hasn't changed since its snapshot was
+#	saved and the snapshot says it is in order.
+#
+#	The journal is applied to the tasks read (see put_top_task). Each of
+#	its records can take at most one task out of the top of the list, so
+#	one more task is read from the file for each record.
+# Inputs:
+#	file_name   -	The name of the todo file
+#	count	    -	The number of tasks wanted
+# Outputs:
+#	dictionary  -	A todo list holding the first count tasks, None if the
+#			whole file has to be loaded instead.
+###################################
+def load_todo_top(file_name, count):
+    (key, header) = load_snapshot_header(file_name)
+    if None == key or None == header or not header.get("ordered"):
+        return None
+    try:
+        file_handle = open(file_name, "rb")
+    except IOError:
+        return None
+    try:
+        # The content isn't hashed, that would mean reading all of it.
+        stat = os.fstat(file_handle.fileno())
+        if key[:3] != (SNAPSHOT_VERSION, stat.st_size, stat.st_mtime):
+            return None
+        records = list(journal_records(file_name, stat.st_ino))
+        lines = []
+        tasks = 0
+        # The priority of the first task not read, None if the whole file
+        # was read.
+        next_pri = None
+        for line in file_handle:
+            line = line.decode("utf-8")
+            if None == SUBTASK_REGEX.match(line) and "" !=\
+                    TASK_PREFIX_REGEX.sub("", COMMENT_REGEX.sub("", line)[:-1]):
+                tasks += 1
+                # Stop at the first task not wanted, the subtasks of the
+                # last task wanted have all been read.
+                if tasks > count + len(records):
+                    next_pri = tokenize_line(line)[1].get("pri", 4)
+                    break
+            lines.append(line)
+    except UnicodeDecodeError:
+        return None
+    finally:
+        file_handle.close()
+    dictionary = parse_todo_lines(lines)
+    # The file is in order, so every task of a higher priority than the
+    # first task not read has been read.
+    complete = None
+    if None != next_pri:
+        complete = next_pri + 1
+    for record in records:
+        if "del" == record["op"]:
+            delete_task(dictionary, record["id"])
+        else:
+            put_top_task(dictionary, journal_task(record), record["moved"],\
+                complete)
     return dictionary
 
 ###################################
 # Purpose:
-#	Print the highlight options menu for the user. A task has already been
-#	chosen at this point.
+#	Apply a put record of the journal to the first tasks of the todo list,
+#	as loaded by load_todo_top. Where the task ends up depends on which
+#	priorities have had all their tasks read:
+#	  - A task staying where it was is replaced in place.
+#	  - A task put at the end of a priority that has been read in full is
+#	    added as it would be to the whole list.
+#	  - A task put at the end of any other priority ends up below the
+#	    tasks read, so it is left out.
 # Inputs:
-#	key	-   The priority level of the task that the user wants to
-#		    modify.
+#	dictionary  -	The first tasks of the todo list
+#	new_entry   -	The task from the record
+#	moved	    -	If the task was moved, from the record
+#	complete    -	The lowest priority whose tasks have all been read,
+#			None if every task has been read.
 # Outputs:
-#	ui	-   The new level of highlighting the user wants.
+#	N/A
 ###################################
-def change_highlighting_menu(key):
-    if 0 == key:
-        program_menu_print("Can't change the highlighting of"\
-            "a completed task. Reopen the task by" + \
-            " changing the priority first.")
-        return dictionary
-    message = "Enter highlighting level: "\
-            + menu_highlight("0") + " (REMOVE), "\
-            + menu_highlight("1") + " (UNDERLINED), "\
-            + menu_highlight("2") + " (BOLD), "\
-            + menu_highlight("3") + " (INVERSE)."
-    program_menu_print(message)
-    # Get the user's new highlighting for this entry.
-    ui = raw_input()
-    return ui
+def put_top_task(dictionary, new_entry, moved, complete):
+    existing = dictionary.ids.get(new_entry.id)
+    if None != existing and not moved and existing.pri == new_entry.pri:
+        put_task(dictionary, new_entry, moved)
+        return
+    if None != existing:
+        delete_task(dictionary, existing.id)
+    if None == complete or new_entry.pri >= complete:
+        put_task(dictionary, new_entry, moved)
 
 ###################################
 # Purpose:
-#	Change the highlighting of the given task.
+#	Apply the records in the journal to the todo list loaded from the file.
+#	Each record holds either the whole of a task as it was when it was
+#	saved or that the task was deleted, so records can be applied in order
+#	with no knowledge of what came before. The first record names the todo
+#	file the journal was started for, a journal left behind by a save that
+#	stopped after the file was replaced is ignored.
+#	  {"op": "base", "ino": <inode of the todo file>}
+#	  {"op": "put", "id": <id>, "moved": <boolean>, "task": <lines>}
+#	  {"op": "del", "id": <id>}
 # Inputs:
-#	dictionary  -	The data structure that contains the task to be
-#			modified.
-#	an_entry    -	The entry who's highlighting is to be changed.
-#	ui	    -	The user defined new highlighting level.
+#	dictionary  -	The todo list loaded from the file
+#	file_name   -	The name of the todo file
 # Outputs:
-#	dictionary  -	The dictionary with the new highlighting for the task.
+#	dictionary  -	The todo list with the journal applied
 ###################################
-def change_highlighting(dictionary, an_entry, ui):
-    # Check the value given by the user makes sense. Report if it is not and
-    # don't use it to change the hiughlighting.
-    try:
-        ui = int(ui)
-        if ui < 0 or ui > 3:
-            raise ValueError
-    except ValueError:
-        program_menu_print("Invalid value, make sure you"\
-            +" use one of the highlighted numbers.\n")
-        return dictionary
-    # Change the highlighting level and return the dictionary.
-    an_entry["lev"] = ui
+def replay_journal(dictionary, file_name):
+    ino = None
+    if None != dictionary.version[0]:
+        ino = dictionary.version[0][0]
+    for record in journal_records(file_name, ino):
+        dictionary.journal += 1
+        if "del" == record["op"]:
+            delete_task(dictionary, record["id"])
+            continue
+        put_task(dictionary, journal_task(record), record["moved"])
     return dictionary
 
 ###################################
 # Purpose:
-#	Display options to the user and gather user input to change the priority
-#	of a task.
+#	Read the put and del records of the journal, see replay_journal.
 # Inputs:
-#	key	-   The level that this task is currently at.
+#	file_name   -	The name of the todo file
+#	ino	    -	The inode of the todo file the records are wanted for,
+#			a journal started for any other file has none.
 # Outputs:
-#	ui	-   The input obtained from the user.
-###################################
-def change_priority_menu(key):
-    # Display the menu to the user
-    if 0 == key:
-        program_menu_print(INVERSE+"Reopening completed task.")
-    message = "Priority levels range from " + menu_highlight("1") + \
-        " (low) to " + menu_highlight("8") + " (high).\n" + \
-        "Enter new priority for task: "
-    program_menu_print(message)
-    # Get the user's choice and return it to the calling function.
-    ui = raw_input()
-    return ui
+#	Generates each record in turn.
+###################################
+def journal_records(file_name, ino):
+    try:
+        file_handle = open(journal_name(file_name), "rb")
+    except IOError:
+        return
+    # Only imported once there is a journal, most loads find none.
+    import json
+    try:
+        for line in file_handle:
+            # A record that was only partly written when the program stopped
+            # is the end of the journal.
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if "base" == record["op"]:
+                if None == ino or record["ino"] != ino:
+                    break
+                continue
+            yield record
+    finally:
+        file_handle.close()
 
+###################################
+# Purpose:
+#	Get the task held by a put record of the journal.
+# Inputs:
+#	record	    -	The record
+# Outputs:
+#	The Task, with the id from the record
+###################################
+def journal_task(record):
+    new_entry = parse_todo_lines(record["task"].splitlines(True))\
+        .ids.values()[0]
+    new_entry.id = record["id"]
+    return new_entry
 
 ###################################
 # Purpose:
-#	This is the function that changes the priority of the task.
+#	Find which todo file a journal was started for.
 # Inputs:
-#	dictionary  -	The dictionary that the task is in
-#	an_entry    -	The task we want to move
-#	ui	    -	Where we want to move the task to
-#	number	    -	The task number the task was in the original priority
+#	journal	    -	The name of the journal
 # Outputs:
-#       Same as the move_entry function (dictionary)
+#	The inode of the todo file from the first record of the journal, None
+#	if the journal doesn't start with one.
 ###################################
-def change_priority(dictionary, an_entry, ui, number):
-    # Error check the user input value.
+def journal_base(journal):
+    import json
+    file_handle = open(journal, "rb")
     try:
-        ui = int(ui)
-        if ui < 1 or ui >= 9:
-            raise ValueError
+        record = json.loads(file_handle.readline())
     except ValueError:
-        program_menu_print("Invalid value, "+ui+" make sure you"\
-            +" use a value in the highlighted range above.\n")
-        return dictionary
-    # Modify the priority level then pass to the move_entry function which
-    # already does what we want.
-    an_entry["pri"] = ui
-    return move_entry(dictionary, an_entry, key, ui, number)
+        return None
+    finally:
+        file_handle.close()
+    if "base" != record.get("op"):
+        return None
+    return record["ino"]
+
+###################################
+# Purpose:
+#	Put a task into the todo list in place of the task with the same id.
+#	Changes that didn't move the task keep it in its place, otherwise it
+#	goes to the end of its priority level. A task with a new id is added.
+# Inputs:
+#	dictionary  -	The todo list
+#	new_entry   -	The Task to put in the list
+#	moved	    -	True if the task was moved when it was changed
+# Outputs:
+#	N/A
+###################################
+def put_task(dictionary, new_entry, moved):
+    dictionary.dues = None
+    existing = dictionary.ids.get(new_entry.id)
+    if None != existing and not moved and existing.pri == new_entry.pri:
+        dictionary[existing.pri].replace(existing, new_entry)
+        dictionary.ids[new_entry.id] = new_entry
+        return
+    if None != existing:
+        dictionary[existing.pri].unlink(existing)
+        dictionary.forget(existing)
+    dictionary[new_entry.pri].append(new_entry)
+    dictionary.register(new_entry)
 
 ###################################
 # Purpose:
-#	Menu and function caller to modify subtasks in a todo list.
+#	Remove the task with an id from the todo list, if it is there.
 # Inputs:
-#	dictionary  -	The dictionary the task is in
-#	an_entry    -	The entry for which we want to modify subtasks.
-#	key	    -	The level this task is at
-#	number	    -	Where in the task list this task appears
+#	dictionary  -	The todo list
+#	task_id	    -	The id of the task
 # Outputs:
-#	dictionary  -	The now modified dictionary
-###################################
-def modify_subtask(dictionary, an_entry, key, number):
-    if 0 == key:
-        program_menu_print("Can't add subtasks to a completed task."\
-            +" Change the priority of the task first.")
-	return dictionary
-    # Pretty print the task we want to modify, the user has had to get through
-    # several layers of menus to get here so they may need reminded of what they
-    # wanted to change.
-    task_string = display_tasks({key : {key : an_entry}})
-    # The number to display will always be one, replace this with the actual
-    # task number
-    task_string = re.sub("1\) ", str(number)+") ",task_string)
-    print task_string.encode('UTF-8')
-    # If the task has no subtask we need to add some before we can modify them.
-    if {} == an_entry["sub"]:
-        dictionary, success = add_subtask_util(dictionary, an_entry, 0)
+#	N/A
+###################################
+def delete_task(dictionary, task_id):
+    dictionary.dues = None
+    existing = dictionary.ids.get(task_id)
+    if None != existing:
+        dictionary[existing.pri].unlink(existing)
+        dictionary.forget(existing)
+
+###################################
+# Purpose:
+#	Apply the changes made to one copy of the todo list to another, newer,
+#	copy. Used when the list has been saved by another run of the program
+#	since this run loaded it.
+# Inputs:
+#	current	    -	The todo list as it is on disk now
+#	dictionary  -	The todo list with this run's changes
+# Outputs:
+#	current	    -	The todo list on disk with this run's changes made to
+#			it, recorded as changes so they are saved.
+###################################
+def merge_changes(current, dictionary):
+    for task_id in dictionary.changed:
+        (an_entry, moved) = dictionary.changed[task_id]
+        if dictionary.ids.get(task_id) is an_entry:
+            put_task(current, an_entry, moved)
+        else:
+            delete_task(current, task_id)
+        current.touch(an_entry, moved)
+    return current
+
+###################################
+# Purpose:
+#	Save the todo list if it has changed. A few changes are appended to the
+#	journal with one write and one fsync; lots of changes, or a journal
+#	that has grown too large, replace the file with the journal folded in
+#	and start a new journal.
+#	Saving holds the lock on the todo file. If the list on disk isn't the
+#	version that was loaded another run of the program has saved it since,
+#	so the list is loaded again and this run's changes are made to that
+#	rather than overwriting the other run's.
+# Inputs:
+#	dictionary  -	The todo list
+#	file_name   -	The name of the todo file
+# Outputs:
+#	dictionary  -	The todo list as saved
+###################################
+def save_todo(dictionary, file_name):
+    if not dictionary.dirty:
         return dictionary
-    # Print the menu for the user
-    message = "To add a new subtask enter "+ menu_highlight("a") + \
-            "; to complete subtask enter " + menu_highlight("c") + \
-            "; to remove subtask enter " + menu_highlight("r") +\
-            "; enter anything else to cancel"
-    program_menu_print(message)
-    # Get the user input, based on this call different functions.
-    ui = raw_input()
-    # a = add new subtask, find what the next subtask should be and pass it to
-    # the add subtask function
-    if "a" == ui.lower():
-        next = int(an_entry["sub"].keys()[-1]) + 1
-        dictionary, success = add_subtask(dictionary, an_entry, next)
-    # Complete a subtask
-    elif "c" == ui.lower():
-        alpha = "abcdefghijklmnopqrstuvwxyz"
-        program_menu_print("Which subtask has been completed:")
-        i = 0
-	# Print what subtasks exist for the user to choose from
-        while i < len(an_entry["sub"].keys())-1:
-            print menu_highlight(alpha[i])+" ",
-            i += 1
-        print menu_highlight(alpha[i])+""+ESCP
-        ui = raw_input()
-        ui.lower()
-	# Need to add error checking for what the user has entered
-	# Find the task the user wanted to complete
-        if "" == ui:
-            program_menu_print("No input, no changes made")
-            return dictionary
-        u = u"\u2714"
-        string = an_entry["sub"][ord(ui)-97]["task"]
-        match = re.search(ur'\u2714', string)
-	# If this subtask hasn't already been completed add a tick and
-	# completion date to the subtask.
-        if None == match:
-            subtask=ord(ui)-97
-            an_entry["sub"][subtask]["task"] =\
-                an_entry["sub"][subtask]["task"]+" "+u
-            an_entry["sub"][subtask]["completed"] = str(time.time())
-    # Completely remove a subtask from the list.
-    elif "r" == ui.lower():
-        alpha = "abcdefghijklmnopqrstuvwxyz"
-        program_menu_print("Which subtask is to be removed:")
-        i = 0
-	# Print the subtask choices
-        while i < len(an_entry["sub"].keys())-1:
-            print menu_highlight(alpha[i])+" ",
-            i += 1
-        print menu_highlight(alpha[i])+""+ESCP
-        ui = raw_input()
-        ui.lower()
-	# Need to add some error checking here
-        if "" == ui:
-            program_menu_print("No input, no changes made.")
-            return dictionary
-        # Remove the task by copying everything over and then deleting the last
-	# subtask which will show up twice.
-	start = ord(ui)-97
-        while start < len(an_entry["sub"].keys())-1:
-            an_entry["sub"][start] = an_entry["sub"][start+1]
-            start += 1
-        del an_entry["sub"][start]
-    # Unknown command just exit
-    else:
-        program_menu_print("Unknown command, doing nothing.")
+    acquire_lock(file_name)
+    try:
+        if todo_version(file_name) != dictionary.version:
+            dictionary = merge_changes(generate_todo_dict(file_name),\
+                dictionary)
+            program_menu_print("The list was saved by another todo.py, "\
+                +"your changes have been added to it.")
+        write_todo(dictionary, file_name)
+        dictionary.version = todo_version(file_name)
+    finally:
+        release_lock(file_name)
     return dictionary
 
 ###################################
 # Purpose:
-#	Menu and function caller for modifying tasks.
+#	Write the changes to the todo list to disk, either to the journal or by
+#	compacting. The lock on the todo file must be held.
 # Inputs:
-#	dictionary  -	The data structure to be modified
-#	number	    -	The task we want to modify
-#	complete    -	Flag to reduce code duplication, completing a task is
-#			just modifying it so add some extra code instead of
-#			duplicating a large chunk of code.
+#	dictionary  -	The todo list, the version on disk
+#	file_name   -	The name of the todo file
 # Outputs:
-#	dictionary  -	The newly modified data structure.
+#	N/A
 ###################################
-def modify_task(dictionary, number, complete=True):
-    # Get all the keys and set up for looping
-    keys = dictionary.keys()
-    keys.sort(reverse=True)
-    task_number = 1
-    file_string = ""
-    for key in keys:
-	# Get each priority dictionary
-        priority_level = dictionary[key]
-        entries = priority_level.keys()
-	# Get all the task keys
-        for selection in entries:
-	    # Loop through the tasks until the task number equals the number
-	    # passed to the function.
-            an_entry = priority_level[selection]
-            if number == task_number:
-                # If completed is true do the required updates else display
-		# menus
-		if complete:
-                    an_entry["lev"] = 5
-                    an_entry["pri"] = 0
-                    an_entry["completed"] = time.time()
-                    temp = an_entry
-                    dictionary = move_entry(dictionary, an_entry, key, 0, selection)
-                else:
-		    # Menu to display to the user
-                    message = "Enter " + menu_highlight("P") + " to change "\
-                        + "priority, "+ menu_highlight("H") + " to change "\
-                        + "highlighting, or " + menu_highlight("S") + \
-                        " to modify subtasks for task " + \
-                        menu_highlight(str(number)) + \
-                        ". Enter anything else to cancel."
-                    program_menu_print(message)
-		    # Get user input
-                    ui = raw_input()
-		    # p means change the priority
-                    if "p" == ui.lower():
-                        new_pri =  change_priority_menu(key)
-			return change_priority(dictionary, an_entry, new_pri,\
-				    selection)
-		    # h means change the highlighting
-                    elif "h" == ui.lower():
-                        new_highlight = change_highlighting_menu(key)
-			return change_highlighting(dictionary, an_entry,\
-				    new_highlight)
-		    # s means modify subtasks
-                    elif "s" == ui.lower():
-                        return modify_subtask(dictionary, an_entry, key, task_number)
-                    # Anything else do nothing
-		    else:
-                        program_menu_print("Unkown command, doing nothing.")
-                # Return the dictionary
-		return dictionary
-	    # Increment the task number
-            task_number += 1
-    # Return the dictionary
-    return dictionary
+def write_todo(dictionary, file_name):
+    journal = journal_name(file_name)
+    try:
+        journal_size = os.path.getsize(journal)
+    except OSError:
+        journal_size = 0
+    # A journal left behind for a todo file that has since been replaced is
+    # of no use, start a new one.
+    if 0 != journal_size\
+            and journal_base(journal) not in (None, os.stat(file_name).st_ino):
+        os.remove(journal)
+        journal_size = 0
+    changes = len(dictionary.changed)
+    if changes <= JOURNAL_MAX_CHANGES and journal_size < JOURNAL_MAX_BYTES\
+            and dictionary.journal + changes <= JOURNAL_MAX_RECORDS:
+        import json
+        records = []
+        if 0 == journal_size:
+            records.append(json.dumps({"op": "base",\
+                "ino": os.stat(file_name).st_ino})+"\n")
+        for task_id in dictionary.changed:
+            (an_entry, moved) = dictionary.changed[task_id]
+            if dictionary.ids.get(task_id) is an_entry:
+                record = {"op": "put", "id": task_id, "moved": moved,\
+                    "task": generate_task_string(an_entry, 1)}
+            else:
+                record = {"op": "del", "id": task_id}
+            records.append(json.dumps(record)+"\n")
+        file_handle = open(journal, "ab")
+        try:
+            file_handle.write("".join(records))
+            file_handle.flush()
+            os.fsync(file_handle.fileno())
+        finally:
+            file_handle.close()
+        dictionary.journal += changes
+        dictionary.saved()
+        save_summary(file_name, summary_key(file_name),\
+            summarise_tasks(dictionary))
+        return
+    # Compact, the journal is only removed once the file holds its changes.
+    dictionary.saved()
+    dictionary.journal = 0
+    dictionary.ordered = True
+    digest = replace_tasks(generate_todo_lines(dictionary), file_name)
+    update_snapshot(file_name, digest, dictionary)
+    if os.path.exists(journal):
+        os.remove(journal)
+    save_summary(file_name, summary_key(file_name), summarise_tasks(dictionary))
 
 ###################################
 # Purpose:
-#	Remove tasks that are no longer relevant but have not been completed.
+#	Move a task from one priority to another, useful when completing a task
+#	and when reducing or increasing the priority of a task. The task is
+#	unlinked from its bucket and added to the end of the new one, neither
+#	of which depends on how many tasks are in the buckets.
+#
 # Inputs:
-#	dictionary  -	The dictionary that is to be modified
-#	number	    -	The task number for the task to be modified
+#	dictionary	-   The data structure containing the item to be
+#			    moved.
+#	an_entry	-   The task that is to be moved.
+#	from_pri	-   The priority that the task is currently in.
+#	to_pri		-   The priority the task is being moved to.
 # Outputs:
-#	dictionary  -	The newely modified dictionary
+#	dictionary	-   The rearanged dictionary with the prioirties sorted
+#			    out.
 ###################################
-def remove_task(dictionary, number):
-    # Get all the keys for the dictionary and sort them, set up everything for
-    # looping.
-    keys = dictionary.keys()
-    keys.sort(reverse=True)
-    task_number = 1
-    for key in keys:
-	# Get each priority level dictionary
-        priority_level = dictionary[key]
-        entries = priority_level.keys()
-        # Loop thoguth each task
-	for selection in entries:
-            an_entry = priority_level[selection]
-	    # Once the task we want to remove has been found do the following.
-	    if number == task_number:
-                task_string = display_tasks({key : {key : an_entry}})
-                task_string = re.sub("1\) ", str(number)+") ",task_string)
-                # Print the task
-		program_menu_print("Task to be removed (there will be no "\
-                    +"record of this): ")
-                print task_string.encode('utf-8')
-		# Make sure the user really wants to delete the task, assume
-		# they don't really.
-                program_menu_print("Are you sure you wish to delete this task?"\
-                    +" [y/N]:")
-                ui = raw_input()
-                if "y" == ui.lower():
-                    # Delete the task
-                    items = dictionary[key].keys()
-                    while selection < len(items)-1:
-                        dictionary[key][selection] = dictionary[key][selection+1]
-                        selection += 1
-                    del dictionary[key][selection]
-                    program_menu_print("Task deleted.")
-                else:
-                    program_menu_print("Task was not deleted.")
-		# Return the dictionary
-                return dictionary
-	    # Increment the task number.
-            task_number += 1
-    # Return the dictionary
+def move_entry(dictionary, an_entry, from_pri, to_pri):
+    # This is terrible form but, why have I done this if statement?
+    # I remember now, level zero elements have highlights that are strike
+    # through, to reopen the task we need to get rid of this highlighting.
+    # And things like this are the reason why we comment as we code kids.
+    if from_pri == 0:
+        an_entry.lev = 0
+    # Take the task out of its current priority level and add it to the end
+    # of the new one.
+    dictionary[from_pri].unlink(an_entry)
+    dictionary[to_pri].append(an_entry)
+    dictionary.touch(an_entry, True)
     return dictionary
+
+###################################
+# Purpose:
+#	Used by the command line parser for options that take several tasks,
+#	each by its number or id, or a range of numbers such as 9-12. Whether
+#	a single value is a number or an id is left to resolve_task, which can
+#	check it against the ids in the list.
+# Inputs:
+#	value	    -	The value given on the command line
+# Outputs:
+#	List of the task numbers (ints) and of the values to resolve (strings)
+###################################
+def task_references(value):
+    (first, dash, last) = value.partition("-")
+    if "" == dash:
+        return [value]
+    if not (first.isdigit() and last.isdigit()) or int(first) > int(last):
+        raise ValueError(value)
+    return range(int(first), int(last) + 1)
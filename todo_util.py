@@ -6,8 +6,12 @@
 
 import re
 import os
-import codecs
+import sys
 import time
+from todo_model import *
+import hashlib
+import cPickle
+import fcntl
 
 # Command line character sequences for different types of highlighting
 BOLD="\033[1m"
@@ -81,77 +85,95 @@ def menu_highlight(string):
 #                       to provide the required colouring and highlighting
 ###################################
 def build_priority_string (pri, lev):
-    priority_string = ""
-
-    # Make sure the inputs are integers
-    pri = int(pri)
-    lev = int(lev)
-
-    # Cap the priority at 8 no matter how large.
-    if pri > 7 :
-        pri = 8
-
-    # Add the correct colouring to the string based on the pri variable
-    if pri <= 0:
-        priority_string += WHITE
-    elif pri == 1:
-        priority_string += HI_GREEN
-    elif pri == 2:
-        priority_string += GREEN
-    elif pri == 3:
-        priority_string += CYAN
-    elif pri == 4:
-        priority_string += HI_BLUE
-    elif pri == 5:
-        priority_string += BLUE
-    elif pri == 6:
-        priority_string += PURPLE
-    elif pri == 7:
-        priority_string += RED
-    elif pri > 7:
-        priority_string += RED+DARKEN
-
-    # Add the correct highlighting to the string based on the lev variable
-    if lev == 1:
-        priority_string += UNDERLINE
-    elif lev == 2:
-        priority_string += BOLD
-    elif lev == 3:
-        priority_string += INVERSE
-    elif lev == 5:
-        priority_string += STRIKE_THROUGH
-    elif lev == 10:
-	   priority_string += DARKEN
-    # return the string with colouring and highlighting.
-    return priority_string
+    # Cap the priority at 8 no matter how large, and at 0 no matter how small.
+    styles = PRIORITY_STYLES[min(max(pri, 0), 8)]
+    # Levels without any highlighting just get the colour.
+    if 0 <= lev < len(styles):
+        return styles[lev]
+    return styles[0]
+
+# Colouring for each priority level, indexed by the priority.
+PRIORITY_COLOURS = (WHITE, HI_GREEN, GREEN, CYAN, HI_BLUE, BLUE, PURPLE, RED,\
+    RED+DARKEN)
+
+# Highlighting for each level of highlighting that has one.
+LEVEL_HIGHLIGHTS = {1: UNDERLINE, 2: BOLD, 3: INVERSE, 5: STRIKE_THROUGH,\
+    10: DARKEN}
+
+# Every combination of colouring and highlighting built once, indexed by
+# [pri][lev], so displaying a task is a lookup.
+PRIORITY_STYLES = [[colour+LEVEL_HIGHLIGHTS.get(lev, "")\
+    for lev in range(max(LEVEL_HIGHLIGHTS) + 1)]\
+    for colour in PRIORITY_COLOURS]
+
+# Table of the metadata flags that can appear on a line in the task files.
+# Each entry is the flag name, the regex its value must match and the type
+# the value is converted to. The flags are pulled out of a line by a single
+# scan (see tokenize_line) so any new flag only needs to be added here.
+FLAGS = (
+    ("pri", r"-?\d+", int),
+    ("lev", r"\d+", int),
+    ("comp", r"\d+\.\d+", float),
+    ("add", r"\d+\.\d+", float),
+    ("due", r"\d+\.\d+", float),
+    ("id", r"[0-9a-zA-Z]+", str),
+)
+
+# One alternation built from the table above, the name of the group that
+# matched tells us which flag was found.
+FLAG_REGEX = re.compile("|".join(["--%s=(?P<%s>%s)" % (name, name, value)\
+    for (name, value, convert) in FLAGS]))
+FLAG_TYPES = dict([(name, convert) for (name, value, convert) in FLAGS])
+
+# Regexes used to tidy up each line before it is tokenized.
+COMMENT_REGEX = re.compile("#.*$")
+TASK_PREFIX_REGEX = re.compile("^[^a-zA-Z]+")
+SUBTASK_REGEX = re.compile("^\s+[a-zA-Z]+\)")
+SUBTASK_PREFIX_REGEX = re.compile("^\s+[a-zA-Z]\)\s+")
+
+###################################
+# Purpose:
+#   Split a line from one of the task files into the text of the task and
+#   the metadata flags attached to it. The line is only scanned once no
+#   matter how many flags are in the table.
+# Inputs:
+#   line    -   The line from the text file that is to be tokenized
+# Outputs:
+#   text    -   The line with all the flags removed and trailing whitespace
+#               stripped.
+#   flags   -   Dictionary of flag name to the value found on the line,
+#               converted to the type given in FLAGS. Only the first value
+#               of a repeated flag is kept.
+###################################
+def tokenize_line(line):
+    flags = {}
+    pieces = []
+    start = 0
+    for match in FLAG_REGEX.finditer(line):
+        name = match.lastgroup
+        if name not in flags:
+            flags[name] = FLAG_TYPES[name](match.group(name))
+        pieces.append(line[start:match.start()])
+        start = match.end()
+    if 0 == start:
+        return (line.rstrip(), flags)
+    pieces.append(line[start:])
+    return ("".join(pieces).rstrip(), flags)
 
 ###################################
 # Purpose:
 #   The text files which the task are loaded from contain some flags
 #   to say how the tasks should be displayed. These flags should not be displayed
-#   on the command line so they are removed by regex in this function.
-#   If any new flags are added to the format they should be removed here.
+#   on the command line so they are removed in this function.
+#   If any new flags are added to the format they should be added to FLAGS.
 # Inputs:
 #   sanitize    -   The line from the text file that is to have flags removed
 # Outputs:
 #   sanitize    -   The freshly sanitized line which should contain only the
 #                   task that is to be displayed.
-# Comments:
-#   Current flags that need to be sanitized:
-#       --lev   -   Level of highlighting
-#       --pri   -   Number reflecting the colour that should be applied
-#       --comp  -   This may not always exist, if it does the task has been
-#                   completed and this is when it was completed in seconds
-#                   since the epoch
 ###################################
 def strip_internal_format (sanitize):
-    sanitize = re.sub("--lev=[0-9]+", "", sanitize)
-    sanitize = re.sub("--pri=(-)?[0-9]+", "", sanitize)
-    sanitize = re.sub("--comp=[0-9]+\.[0-9]+", "", sanitize)
-    sanitize = re.sub("--add=[0-9]+\.[0-9]+", "", sanitize)
-    sanitize = re.sub("--due=[0-9]+\.[0-9]+", "", sanitize)
-    sanitize = re.sub("\s+$", "", sanitize)
-    return sanitize
+    return tokenize_line(sanitize)[0]
 
 ###################################
 # Purpose:
@@ -159,7 +181,7 @@ def strip_internal_format (sanitize):
 #   if there are any. If any are found they are added to the dictionary entry
 #   under the sublevel key.
 # Inputs:
-#   dictionary  -   The dictionary to add to
+#   an_entry    -   The task to add the subtasks to
 #   index       -   The current index of where we are in the list that is passed
 #   lines       -   The text file in a list form where one entry is one line from
 #                   file.
@@ -167,7 +189,7 @@ def strip_internal_format (sanitize):
 #   index + delta - 1   -   This is where we should continue processing the
 #                           list from when we return to the caller.
 ###################################
-def check_for_sublevels(dictionary, index, lines):
+def check_for_sublevels(an_entry, index, lines):
     # delta is the temporary index that we will be using.
     delta = 1
 
@@ -178,67 +200,257 @@ def check_for_sublevels(dictionary, index, lines):
         return index # Index + delta is invalid return the last known good index
     # Sub-levels take the form "\s+<letter>)" if this isn't the first thing on
     # the line then this isn't a sublevel.
-    match = re.match("^\s+[a-zA-Z]+\)", line)
+    match = SUBTASK_REGEX.match(line)
     if None == match: # Regex didn't match
         return index # Return last known good index.
 
-    # Assign the sub key value to sublevels for easy access
-    sublevels = dictionary["sub"]
-    count = 0
-
     # While there are still sublevels loop
     while None != match:
         # Sanitize line
-        line = re.sub("#.*$", "", line)
+        line = COMMENT_REGEX.sub("", line)
         line = line[:-1]
-        line = re.sub("^\s+[a-zA-Z]\)\s+", "", line)
+        line = SUBTASK_PREFIX_REGEX.sub("", line)
 
         # If line contains content
         if line != "":
-            # Record completion date if it exists.
-            match = re.search("--comp=(\d+\.\d+)", line)
-            if None != match:
-                comp = match.group(1)
-            else:
-                comp = 0
-            line = strip_internal_format(line) # Remove flags
-            sublevels[count] = {"task": line} # Store each subtask as it's own dictionary
-            if comp > 0:
-                sublevels[count]["completed"] = comp # Add completion to the subtask if it exists
-            count += 1
+            # Remove flags, recording the completion date if it exists.
+            line, flags = tokenize_line(line)
+            # Store each subtask with its completion date if it exists
+            an_entry.add_subtask(Subtask(line, flags.get("comp")))
             delta += 1
             if index + delta > len(lines)-1: # If there are no more entries in the list return last index
                 return (index + delta - 1)
             line = lines[(index+delta)] # Move to the next line
-            match = re.match("^\s+[a-zA-Z]+\)", line) # Complete the condition that we check for the loop
+            match = SUBTASK_REGEX.match(line) # Complete the condition that we check for the loop
     return (index + delta - 1) # We advance one too far so add the delta minus one to the original index
 
+# Parsed versions of the task files are kept in a hidden snapshot file next
+# to the text file so that they don't need to be parsed on every run. Bump the
+# version whenever the parsed structures change shape so old snapshots are
+# ignored. A snapshot holds two pickles, the key with a small header about the
+# structure, which can be read on its own, and then the structure itself.
+SNAPSHOT_VERSION = 9
+
 ###################################
 # Purpose:
-#       Read files into a list in a safe manner, reduce code duplication
+#       Build the name of a hidden file that lives alongside one of the task
+#       files, e.g. ~/tasks/todo -> ~/tasks/.todo.cache
 # Inputs:
-#       file_name   -   Name of the file to load (full qualified path in all the code here)
+#       file_name   -   The task file the sidecar belongs to
+#       suffix      -   The extension to give the sidecar file
 # Outputs:
-#       contents    -   A list of all the lines contained in the file file_name
+#       The full path of the sidecar file
+###################################
+def sidecar_name(file_name, suffix):
+    directory, base = os.path.split(file_name)
+    return os.path.join(directory, "."+base+"."+suffix)
+
 ###################################
-def read_file(file_name):
+# Purpose:
+#       Work out the key a snapshot of a task file is stored under. Any change
+#       to the file, either by this program or by hand, changes the key.
+# Inputs:
+#       stat    -   The result of os.stat/os.fstat on the task file
+#       digest  -   The SHA-1 hex digest of the content of the task file
+# Outputs:
+#       key     -   Tuple of the snapshot version, the size, the modification
+#                   time and a hash of the content of the file.
+###################################
+def snapshot_key(stat, digest):
+    return (SNAPSHOT_VERSION, stat.st_size, stat.st_mtime, digest)
+
+###################################
+# Purpose:
+#       Load the snapshot of a task file if there is one and it is still
+#       valid for the file as it is on disk.
+# Inputs:
+#       file_name   -   The task file the snapshot was taken of
+#       key         -   The key of the task file as it currently is
+# Outputs:
+#       data        -   The parsed structure, None if there is no valid
+#                       snapshot.
+###################################
+def load_snapshot(file_name, key):
     try:
-    # Open file
-        file_handle = codecs.open(file_name, mode="r", encoding="utf-8")
-    # Read contents
-        contents = file_handle.readlines()
-    # Close file
-        file_handle.close()
-    # Deal with exceptions
+        file_handle = open(sidecar_name(file_name, "cache"), "rb")
+        try:
+            (snapshot, header) = cPickle.load(file_handle)
+            # Don't load the structure if it is out of date.
+            if snapshot != key:
+                return None
+            return cPickle.load(file_handle)
+        finally:
+            file_handle.close()
+    # A missing or broken snapshot just means the file has to be parsed.
+    except Exception:
+        return None
+
+###################################
+# Purpose:
+#       Read only the key and header of a snapshot, without loading the
+#       structure.
+# Inputs:
+#       file_name   -   The task file the snapshot was taken of
+# Outputs:
+#       key         -   The key the snapshot was saved with, None if there
+#                       is no snapshot.
+#       header      -   The header saved with it (see snapshot_header)
+###################################
+def load_snapshot_header(file_name):
+    try:
+        file_handle = open(sidecar_name(file_name, "cache"), "rb")
+        try:
+            return cPickle.load(file_handle)
+        finally:
+            file_handle.close()
+    except Exception:
+        return (None, None)
+
+###################################
+# Purpose:
+#       Work out the header to save with a snapshot, what can be known about
+#       a task file without loading its structure.
+# Inputs:
+#       data        -   The parsed structure
+# Outputs:
+#       Dictionary of facts about the structure, None if there are none.
+###################################
+def snapshot_header(data):
+    if isinstance(data, TaskList):
+        return {"ordered": data.ordered}
+    return None
+
+###################################
+# Purpose:
+#       Write a sidecar of a task file. The sidecar is written to a
+#       temporary file and moved into place so a half written sidecar is
+#       never read.
+# Inputs:
+#       file_name   -   The task file the sidecar belongs to
+#       suffix      -   The suffix of the sidecar
+#       write       -   Function given the open temporary file to write the
+#                       contents of the sidecar to it.
+# Outputs:
+#       N/A
+###################################
+def save_sidecar(file_name, suffix, write):
+    cache_name = sidecar_name(file_name, suffix)
+    temp_name = cache_name+"."+str(os.getpid())
+    try:
+        file_handle = open(temp_name, "wb")
+        try:
+            write(file_handle)
+        finally:
+            file_handle.close()
+        os.rename(temp_name, cache_name)
+    # Sidecars are only an optimisation, failing to write one is not an
+    # error.
+    except Exception:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+
+###################################
+# Purpose:
+#       Store the parsed structure for a task file in its snapshot.
+# Inputs:
+#       file_name   -   The task file the structure was parsed from
+#       key         -   The key of the task file the structure represents
+#       data        -   The parsed structure
+# Outputs:
+#       N/A
+###################################
+def save_snapshot(file_name, key, data):
+    def write(file_handle):
+        cPickle.dump((key, snapshot_header(data)), file_handle,\
+            cPickle.HIGHEST_PROTOCOL)
+        cPickle.dump(data, file_handle, cPickle.HIGHEST_PROTOCOL)
+    save_sidecar(file_name, "cache", write)
+
+###################################
+# Purpose:
+#       Update the snapshot of a task file that has just been written so the
+#       next run doesn't need to parse the file again.
+# Inputs:
+#       file_name   -   The task file that was written
+#       digest      -   The SHA-1 hex digest of what was written to the file,
+#                       as returned by write_tasks and replace_tasks.
+#       data        -   The structure the file was generated from
+# Outputs:
+#       N/A
+###################################
+def update_snapshot(file_name, digest, data):
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return
+    save_snapshot(file_name, snapshot_key(stat, digest), data)
+
+###################################
+# Purpose:
+#       Load a task file into its internal structure, using the snapshot of
+#       the file when it is still valid and only running the parser when it
+#       is not.
+# Inputs:
+#       file_name   -   Name of the task file to load
+#       parser      -   Function that takes the lines of the file and returns
+#                       the internal structure.
+# Outputs:
+#       data        -   The internal structure for the file
+###################################
+def load_parsed(file_name, parser):
+    try:
+        file_handle = open(file_name, "rb")
+        try:
+            raw = file_handle.read()
+            stat = os.fstat(file_handle.fileno())
+        finally:
+            file_handle.close()
     except IOError as e:
         print "Problem with the file\nError message ({0}): {1}".format(e.errno,\
             e.strerror)
         exit(e.errno)
-    # TODO: Mod this so it fails gracefully but displays what the actual error was
-    except Exception as e:
-        print "Something went wrong while reading the file. Encoding maybe."
-        exit(0)
-    return contents
+    key = snapshot_key(stat, hashlib.sha1(raw).hexdigest())
+    data = load_snapshot(file_name, key)
+    if data is None:
+        try:
+            contents = raw.decode("utf-8").splitlines(True)
+        except UnicodeDecodeError:
+            print "Something went wrong while reading the file. Encoding maybe."
+            exit(0)
+        data = parser(contents)
+        save_snapshot(file_name, key, data)
+    return data
+
+# How many formatted times are remembered before they are all forgotten.
+TIME_CACHE_SIZE = 4096
+# Formatted times, (whole seconds, format) to the string.
+TIME_STRINGS = {}
+
+###################################
+# Purpose:
+#	Format a time for display, remembering the results since the same
+#	times are shown again and again. The local time is taken in whole
+#	seconds, so that is all the key needs.
+# Inputs:
+#	timestamp   -	Time in seconds since the epoch
+#	fmt	    -	The time.strftime format, None for time.asctime
+# Outputs:
+#	string	    -	The formatted local time
+###################################
+def format_time(timestamp, fmt=None):
+    key = (int(timestamp), fmt)
+    string = TIME_STRINGS.get(key)
+    if None == string:
+        if None == fmt:
+            string = time.asctime(time.localtime(timestamp))
+        else:
+            string = time.strftime(fmt, time.localtime(timestamp))
+        if len(TIME_STRINGS) >= TIME_CACHE_SIZE:
+            TIME_STRINGS.clear()
+        TIME_STRINGS[key] = string
+    return string
 
 ###################################
 # Purpose:
@@ -251,235 +463,248 @@ def read_file(file_name):
 #                       to the tasks and subtask in this entry.
 #       task_num    -   The nth task that has appeared in the task list. This number is
 #                       used internally when changes are made to a task.
-#       an_entry    -   The data structure that represents the task that we want to
-#                       display.
-#               {
-#                   "line": <text>
-#                   "pri": <number>
-#                   "lev": <number>
-#                   ?"completed": <number>?
-#                   ?sub:{
-#                          <0>:{"task":<text>
-#                                    ?"completed":<number>?}
-#                           .
-#                           .
-#                           <n>:{"task":<text>
-#                                    ?"completed":<number>?}
-#                       }?
-#               }
+#       an_entry    -   The Task that we want to display.
 # Outputs:
 #       display_string  -   The combination of the priority string and all 
 #                           "line" values and sublevel "task" values
 ###################################
 def generate_output_string(pri_str, task_num, an_entry):
     # Add highlighting and the number for this task and then content
-    display_string = pri_str+str(task_num)+") " + an_entry["line"]
-    display_string += ESCP
-    if "due" in an_entry:
-	display_string += menu_highlight(" (Due: "+time.asctime
-		(time.localtime(float(an_entry["due"])))+")")+ESCP
+    return pri_str+str(task_num)+") "+an_entry.line\
+        +generate_task_details(pri_str, an_entry)
+
+###################################
+# Purpose:
+#       Generate the display of a task after its text, as
+#       generate_output_string. Kept apart so it can be cached without the
+#       number, which changes whenever a task above it is added or removed,
+#       and without the text, which the task already holds.
+# Inputs:
+#       pri_string  -   The string that will be used to provide highlighting and colour
+#                       to the tasks and subtask in this entry.
+#       an_entry    -   The Task that we want to display.
+# Outputs:
+#       display_string  -   The display of the task after its text: the due
+#                           and completion dates and the subtasks.
+###################################
+def generate_task_details(pri_str, an_entry):
+    display_string = ESCP
+    if None != an_entry.due:
+        display_string += menu_highlight(" (Due: "+format_time(\
+            an_entry.due)+")")+ESCP
 
     # If the task has been completed add the completion date and time
-    if "completed" in an_entry:
-        display_string += menu_highlight("\tCompleted "+time.asctime(\
-            time.localtime(float(an_entry["completed"]))))+ESCP
+    if None != an_entry.completed:
+        display_string += menu_highlight("\tCompleted "+format_time(\
+            an_entry.completed))+ESCP
     display_string += "\n"
 
-    # If the sub level value is not empty add the sub tasks to the string
-    if an_entry["sub"] != {}:
-        sublevels = an_entry["sub"]
-        # Subtask identifier uses letters instead of numbers.
-        # The below string is indexed by the subtask number and used
-        # for the identifier.
-        alpha = "abcdefghijklmnopqrstuvwxyz"
-        subkeys = sublevels.keys()
-        for key in subkeys:
-            # Add the subtask text to the string with an identifier
-            display_string += pri_str+"\t"+alpha[key]+") "\
-                +sublevels[key]["task"]+ESCP
-            # If the subtask has been completed add the completion date to the string
-            if "completed" in sublevels[key]:
-                display_string += menu_highlight("\tCompleted "+time.asctime(\
-                    time.localtime(float(sublevels[key]["completed"]))))+ESCP
-            display_string+="\n"
+    # Add the sub tasks to the string
+    # Subtask identifier uses letters instead of numbers.
+    # The below string is indexed by the subtask number and used
+    # for the identifier.
+    alpha = "abcdefghijklmnopqrstuvwxyz"
+    for (key, subtask) in enumerate(an_entry.sub):
+        # Add the subtask text to the string with an identifier
+        display_string += pri_str+"\t"+alpha[key]+") "+subtask.task+ESCP
+        # If the subtask has been completed add the completion date to the string
+        if None != subtask.completed:
+            display_string += menu_highlight("\tCompleted "+format_time(\
+                subtask.completed))+ESCP
+        display_string+="\n"
     # Return the assembled task for printing.
     return display_string
 
+# Size of the buffer used when writing the task files.
+WRITE_BUFFER = 65536
+
 ###################################
 # Purpose:
-#       Write tasks to a file in a safe manner, reduce code duplication
+#       Write tasks to a file in a safe manner, reduce code duplication.
+#       The lines are encoded and written as they are generated so the whole
+#       file is never held in memory.
 # Inputs:
-#       file_string -   The string that is to be written to the file
+#       lines       -   The strings that are to be written to the file, one
+#                       or more lines at a time.
 #       file_name   -   The name of the file that we want to write to
 #       mode        -   The mode to open the file in (write, or append)
 # Outputs:
-#
+#       digest      -   SHA-1 hex digest of what was written
 ###################################
-def write_tasks(file_string, file_name, file_mode):
+def write_tasks(lines, file_name, file_mode):
+    digest = hashlib.sha1()
     try:
     # Open file
-        file_handle = codecs.open(file_name, mode=file_mode, encoding="utf-8")
-    # Read contents
-        file_handle.write(file_string)
+        file_handle = open(file_name, file_mode+"b", WRITE_BUFFER)
+    # Write contents, any other error from making the lines is left to the
+    # caller.
+        try:
+            for line in lines:
+                chunk = line.encode("utf-8")
+                digest.update(chunk)
+                file_handle.write(chunk)
     # Close file
-        file_handle.close()
+        finally:
+            file_handle.close()
     # Deal with I/O errors
     except IOError as e:
         print "Problem with the file\nError message ({0}): {1}".format(e.errno,\
             e.strerror)
         exit(e.errno)
-    # Deal with any other errors
-    # TODO: modify this to display the actual error that was encountered.
-    except:
-        print "Something went wrong with writing the file, encoding maybe."
-        exit(0)
+    # Deal with encoding errors
+    except UnicodeError as e:
+        print "Something went wrong with writing the file, encoding maybe."\
+            +"\nError message: "+str(e)
+        exit(1)
+    return digest.hexdigest()
 
 ###################################
 # Purpose:
-#       This function builds the string that will be written to the done file
+#       Build the lines of the task files for the subtasks of a task. Shared
+#       by the functions that turn the todo and done lists into strings.
+# Inputs:
+#       an_entry    -   The task whose subtasks are to be converted
+# Outputs:
+#       task_string -   The subtask lines, empty if there are no subtasks.
+###################################
+def generate_subtask_string(an_entry):
+    task_string = ""
+    alpha = "abcdefghijklmnopqrstuvwxyz"
+    for (key, subtask) in enumerate(an_entry.sub):
+        task_string += "\t"+alpha[key]+") "+subtask.task
+        if None != subtask.completed:
+            task_string += " --comp="+repr(subtask.completed)
+        task_string += "\n"
+    return task_string
+
+###################################
+# Purpose:
+#       Write a new version of a task file in place of the old one. The new
+#       version is written to a temporary file, synced to disk and renamed
+#       over the old one, so anyone reading the file sees either the old or
+#       the new version in full and a crash never leaves it half written.
+# Inputs:
+#       lines       -   The strings making up the new contents of the file
+#       file_name   -   The name of the file that we want to write to
+# Outputs:
+#       digest      -   SHA-1 hex digest of the new contents of the file
+###################################
+def replace_tasks(lines, file_name):
+    temp_name = file_name+"."+str(os.getpid())
+    renamed = False
+    try:
+        digest = write_tasks(lines, temp_name, "w")
+        file_handle = open(temp_name, "rb")
+        try:
+            os.fsync(file_handle.fileno())
+        finally:
+            file_handle.close()
+        # The new file keeps the permissions of the one it replaces.
+        if os.path.exists(file_name):
+            os.chmod(temp_name, os.stat(file_name).st_mode & 07777)
+        os.rename(temp_name, file_name)
+        renamed = True
+    except (IOError, OSError) as e:
+        print "Problem with the file\nError message ({0}): {1}".format(e.errno,\
+            e.strerror)
+        exit(e.errno)
+    finally:
+        # Whatever stopped the new version being moved into place, don't
+        # leave it behind.
+        if not renamed and os.path.exists(temp_name):
+            os.remove(temp_name)
+    return digest
+
+###################################
+# Purpose:
+#       Work out the identity of a file so a change to it can be noticed.
+# Inputs:
+#       file_name   -   The name of the file
+# Outputs:
+#       (inode, size, mtime) of the file, None if it doesn't exist.
+###################################
+def file_key(file_name):
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+# Locks held by this process, lock file name to (open lock file, depth).
+HELD_LOCKS = {}
+
+###################################
+# Purpose:
+#       Take the lock for changing a task file, waiting for whoever holds it.
+#       The lock is an advisory fcntl lock on a hidden file beside the task
+#       file, e.g. ~/tasks/.todo.lock. Only changes take the lock, reading
+#       the files never waits. A lock already held by this process is taken
+#       again without waiting.
+# Inputs:
+#       file_name   -   The task file to lock
+# Outputs:
+#       N/A
+###################################
+def acquire_lock(file_name):
+    lock_name = sidecar_name(file_name, "lock")
+    if lock_name in HELD_LOCKS:
+        (file_handle, depth) = HELD_LOCKS[lock_name]
+        HELD_LOCKS[lock_name] = (file_handle, depth + 1)
+        return
+    file_handle = open(lock_name, "a")
+    fcntl.flock(file_handle.fileno(), fcntl.LOCK_EX)
+    HELD_LOCKS[lock_name] = (file_handle, 1)
+
+###################################
+# Purpose:
+#       Give up the lock taken by acquire_lock.
+# Inputs:
+#       file_name   -   The task file to unlock
+# Outputs:
+#       N/A
+###################################
+def release_lock(file_name):
+    lock_name = sidecar_name(file_name, "lock")
+    (file_handle, depth) = HELD_LOCKS[lock_name]
+    if depth > 1:
+        HELD_LOCKS[lock_name] = (file_handle, depth - 1)
+        return
+    del HELD_LOCKS[lock_name]
+    fcntl.flock(file_handle.fileno(), fcntl.LOCK_UN)
+    file_handle.close()
+
+###################################
+# Purpose:
+#       This function builds the lines that will be written to the archive
 #       when clean up is performed. As the tasks have already been completed no
 #       priority or highlight information is carried over, only the completion
 #       date.
 # Inputs:
-#       dictionary  -   The dictionary that is to be converted to a string.
+#       tasks       -   The list of tasks that is to be converted to lines.
 # Outputs:
-#       file_string -   The string representing the dictionary.
+#       task_string -   Generates the lines for each task in turn.
 ###################################
-def generate_cleanup_string(dictionary):
-    # Get the keys in the dictionary and sort them in reverse.
-    keys = dictionary.keys()
-    keys.sort(reverse=True)
+def generate_cleanup_lines(tasks):
 
     # Identifier for the task.
     task_number = 1
 
-    # String to store the text in.
-    file_string = ""
-
-    # Get each entry in the dictionary add the text, completion date, and
+    # Get each task, newest first, add the text, completion date, and
     # subtasks to the string. Increment the counter by one each time
-    for entry in keys:
-        an_entry = dictionary[entry]
-        task_string = str(task_number)+") "+an_entry["line"]
-        if "completed" in an_entry:
-            task_string += " --comp="+str(an_entry["completed"])
-	if "add" in an_entry:
-	    task_string += " --add="+str(an_entry["add"])
-	if "due" in an_entry:
-	    task_string += " --due="+str(an_entry["due"])
+    for an_entry in reversed(tasks):
+        task_string = str(task_number)+") "+an_entry.line
+        if None != an_entry.completed:
+            task_string += " --comp="+repr(an_entry.completed)
+        if None != an_entry.add:
+            task_string += " --add="+repr(an_entry.add)
+        if None != an_entry.due:
+            task_string += " --due="+repr(an_entry.due)
+        if None != an_entry.id:
+            task_string += " --id="+an_entry.id
         task_string += "\n"
-        if an_entry["sub"] != {}:
-            sublevels = an_entry["sub"]
-            alpha = "abcdefghijklmnopqrstuvwxyz"
-            subkeys = sublevels.keys()
-            for key in subkeys:
-                task_string += "\t"+alpha[key]+") "+sublevels[key]["task"]
-                if "completed" in sublevels[key]:
-                    task_string += " --comp="+str(sublevels[key]\
-                        ["completed"])
-                task_string+="\n"
-        file_string += task_string
+        task_string += generate_subtask_string(an_entry)
+        yield task_string
         task_number += 1
-    # Return the string representing the dictionary ready for writing to
-    # a file
-    return file_string
-
-###################################
-# Purpose:
-#       This function is used to clean up the todo dictionary, removing the
-#       completed tasks. At the same time the completed tasks are written to
-#       a file so they can be reviewed in the future.
-# Inputs:
-#       dictionary  -   The todo dictionary that contains all the tasks.
-#                       Completed and in progress
-# Outputs:
-#       dictionary  -   The todo dictionary that now contains only the in
-#                       progress tasks.
-###################################
-def clean_up(dictionary):
-    # Completed tasks are the value for the key "0" in the data structure.
-    cleanup_dict = dictionary[0]
-    # Clear out the completed tasks in the dictionary
-    dictionary[0] = {}
-    # Remove level and priority meta data from the dictionary
-    for entry in cleanup_dict:
-        an_entry = cleanup_dict[entry]
-        del an_entry["lev"]
-        del an_entry["pri"]
-    # Set the path to the usual file
-    home = os.getenv("HOME")
-    path = home+"/tasks"
-    file_handle = path+"/done"
-    # Create the string that is to be written to the file
-    file_string = generate_cleanup_string(cleanup_dict)
-    # Write to the file
-    write_tasks(file_string, file_handle, "a")
-    # Return the dictionary that was passed in
-    return dictionary
-
-###################################
-# Purpose:
-#       Utility function was created so the same code could be used
-#       for creation of tasks and modification of existing tasks.
-#       This is why when a task is created you see the "Task has no subtasks."
-#       message.
-# Inputs:
-#       dictionary  -   The parent dictionary that is being modified
-#                       (Do I need this? Pass by reference of pass by value?)
-#       entry       -   The entry that is to be modified with a new subtask
-#       subtask_num -   The number that this subtask should take. This should
-#                       be current number of subtasks + 1
-# Outputs:
-#       dictionary  -   The dictionary that should now be modified with a new
-#                       subtask in entry
-#       0/1         -   Boolean really showing if the addition was successful
-#                       or not.
-###################################
-def add_subtask(dictionary, entry, subtask_num):
-    # Create message to be shown to the user, then print it
-    message = ""
-    if 0 == subtask_num:
-        message = "Task has no subtasks. "
-    message += "Enter text for new subtask (an identifier will be added by "\
-        +"the program):"
-    program_menu_print(message)
-    # Get users response
-    ui = raw_input()
-    if "" == ui:
-        program_menu_print("No text entered, no subtask created")
-        return (dictionary, 0)
-    # Add the new subtask to the dictionary
-    entry["sub"][subtask_num] = {"task": ui}
-    return (dictionary, 1)
-
-###################################
-# Purpose:
-#       Allow multiple subtasks to be added to a task at the one time.
-#       (Add subtasks until the user explicitly says no more.)
-# Inputs:
-#       dictionary  -   The dictionary containing the entry
-#       entry       -   The entry we're going to add the subtask to.
-# Outputs:
-#       dictionary  -   The dictionary which should now contain extra subtasks
-#                       in the entry.
-# Comment:
-#       Dictionaries must be pass by reference, look this up.
-###################################
-def add_subtasks_menu(dictionary, entry):
-    condition = True
-    count = 0
-    # Set to true to loop indefinitely
-    while condition:
-        # Call the utility function to actually add the subtask
-        dictionary, success = add_subtask(dictionary, entry, count)
-        count += success # Only increment count when tasks are actually added.
-        # Find out if the user wants to add more tasks
-        program_menu_print("Any more subtasks? [Y/n]")
-        ui = raw_input()
-        if "n" == ui.lower():
-            condition = False
-    # Return the dictionary
-    return dictionary
 
 def number_to_month(month):
 	"""docstring for number_to_month"""
@@ -511,146 +736,6 @@ def number_to_month(month):
 	    raise ValueError
 ###################################
 # Purpose:
-#	This function gets the due date for task from the user.
-#
-# Inputs:
-#	N/A everything is picked up from the user inside the function
-#
-# Outputs:
-#	due_date    -	A floating point number representing the due date for
-#			the task.
-###################################
-def get_due_date():
-    today = time.time()
-    today_tuple = time.localtime(today)
-    day = today
-    month = ""
-    year = ""
-    hour = 23
-    minute = 59
-    seconds = 59
-    # Get the day from the user default to today
-
-    msg = "Enter the day of completion: [ Defaults to today: "+\
-	    str(today_tuple[2])+" ]"
-    program_menu_print(msg)
-    ui = raw_input()
-    if "" == ui:
-	day = today_tuple[2]
-    elif int(ui) < 1 or int(ui) > 31:
-	program_menu_print("That is not a real date, using the default")
-	day = today_tuple[2]
-    else:
-	day = int(ui)
-    # Get the month from the user. Default to the current month or if the day is
-    # less than today the next month.
-    default_month = today_tuple[1]
-    if day < today_tuple[2]:
-	default_month += 1
-    if default_month > 12:
-	default_month = 1
-    msg = "Enter the month of completion: "+menu_highlight("1 - 12")+" [Default:"\
-	    +" "+str(default_month)+" ("+ number_to_month(default_month) +") ]"
-    program_menu_print(msg)
-    ui = raw_input()
-    if "" == ui:
-	month = default_month
-    elif int(ui) < 1 or int(ui) > 12:
-	program_menu_print("That is not a real month, using the default")
-	month = default_month
-    else:
-	month = int(ui)
-
-    # Get the year from the user. Default to the current year unless the month
-    # is less than today's month
-    default_year = today_tuple[0]
-    if month < today_tuple[1]:
-	default_year += 1
-    msg = "Enter the year of completion: "+menu_highlight("YYYY format")+\
-	   "[Default: "+str(default_year)+" ]"
-    program_menu_print(msg)
-    ui = raw_input()
-    if "" == ui:
-	year = default_year
-    elif int(ui) < default_year:
-	program_menu_print("I can't let you set a task in the past. Using the \
-		default")
-	year = default_year
-    else:
-	year = int(ui)
-    program_menu_print("Due date for this task is the end of: "+\
-	    menu_highlight(str(day) +" "+ number_to_month(month)+" "+str(year)))
-    new_date = (year, month, day, hour, minute, seconds, -1, -1 ,-1)
-    due_date = time.mktime(new_date)
-    return due_date
-    # Convert the user input to a floating point number representing the date
-    # and return it to the caller.
-
-###################################
-# Purpose:
-#       The menu to display when adding a new task to the todo list
-# Inputs:
-#       N/A
-# Outputs:
-#       line    -   The text for the new task
-#       pri     -   Priority the user wants
-#       lev     -   Level of highlighting the user wants
-#       success -   If the user input was collected correctly
-###################################
-def add_task_menu():
-    # Ask user to enter test and collect it
-    program_menu_print("Enter the text for the new task:")
-    ui = raw_input()
-    if "" == ui:
-        program_menu_print("No input no new task added.")
-        return ("", "", "", "",  0)
-    line = ui
-    program_menu_print("Is there a due date for this task? y/N")
-    ui = raw_input()
-    if "y" == ui.lower():
-	due = get_due_date()
-    else:
-	due = 0
-    # Ask user to enter priority and collect it
-    message = "Enter priority from " + menu_highlight("1") + \
-        " to " + menu_highlight("8") + " (default is 4): "
-    program_menu_print(message)
-    ui = raw_input()
-    try:
-        ui = int(ui)
-        if ui < 1:
-            ui = 1
-        elif ui > 8:
-            ui = 8
-    except ValueError:
-        program_menu_print("Non-interger value entered defaulting to priority"+\
-            "4")
-        ui = 4
-    pri = ui
-
-    # Ask user to enter level of highlighting and collect it
-    message = "Enter highlight level " + menu_highlight("0") + \
-          " (NO HIGHLIGHTING), " + menu_highlight("1") + \
-          " (UNDERLINED), " + menu_highlight("2") + \
-          " (BOLD), " + menu_highlight("3") + \
-          " (INVERSE).\nDefault is 0: "
-    program_menu_print(message)
-    ui = raw_input()
-    try:
-        ui=int(ui)
-        if ui < 1 or ui > 3:
-            ui = 0
-    except ValueError:
-        program_menu_print("Non-integer value entered; defaulting to no"+\
-            "highlighting.")
-        ui = 0
-    lev = ui
-
-    # Return what the user has entered
-    return (line, pri, lev, due, 1)
-
-###################################
-# Purpose:
 #       Add a task to the task list, tasks can't be added to the done list
 #       using this manner.
 # Inputs:
@@ -659,51 +744,141 @@ def add_task_menu():
 #       dictionary  -   The dictionary that now has another task added to it.
 ###################################
 def add_task(dictionary, line, pri, lev, due):
-    next = len(dictionary[pri].keys())
-    dictionary[pri][next] = {"line" : line, "pri" : pri, "lev" : lev, \
-	    "added":time.time(), "sub" : {} }
+    new_entry = Task(line, pri, lev, add=time.time())
     if 0 != due:
-	dictionary[pri][next]["due"] = due
-    new_entry = dictionary[pri][next]
+        new_entry.due = due
+    dictionary[pri].append(new_entry)
+    dictionary.register(new_entry)
+    dictionary.touch(new_entry, True)
     return (dictionary, new_entry)
 
 
 ###################################
 # Purpose:
-#	This takes every task feeds it to a function that builds the string,
-#	these strings are then concatinated together and returned to the calling
-#	function.
-#
+#	Build the display of the tasks in the dictionary one task at a time, in
+#	the order they are numbered.
 # Inputs:
-#	dictionary  -	The structure that is to be made into a string
-#
+#	dictionary  -	The dictionary that contains all the tasks.
+#	first	    -	The number of the first task to display
+#	last	    -	The number of the last task to display, None for all
 # Outputs:
-#	display_string	-   The string that represents the formatted dictionary
-#			    for display
+#	display_string	-   Generates the display of each task in turn, with
+#			    its subtasks.
 ###################################
-def display_tasks(dictionary):
+def generate_display_lines(dictionary, first=1, last=None):
+    for (task_number, an_entry) in numbered_tasks(dictionary, first, last):
+        yield generate_output_string(build_priority_string(an_entry.pri,\
+            an_entry.lev), task_number, an_entry)
+
+###################################
+# Purpose:
+#	Go through the tasks in the dictionary in the order they are numbered.
+# Inputs:
+#	dictionary  -	The dictionary that contains all the tasks.
+#	first	    -	The number of the first task to go through
+#	last	    -	The number of the last task to go through, None for all
+# Outputs:
+#	Generates (task_number, an_entry) for each task in turn.
+###################################
+def numbered_tasks(dictionary, first=1, last=None):
     # Get the keys from the dictionary.
     keys = dictionary.keys()
     keys.sort(reverse=True)
     task_number = 1
-    display_string = ""
 
     # Loop through all the tasks.
     for key in keys:
-        priority_level = dictionary[key]
-        entries = priority_level.keys()
-        for key in entries:
-	    # Pick the next entry.
-            an_entry = priority_level[key]
-
-	    # Get the priority string.
-            priority_string = build_priority_string(an_entry["pri"],\
-                an_entry["lev"])
-
-	    # Add the task specific string to the display string
-            display_string += generate_output_string(priority_string, \
-                task_number, an_entry)
+        # Skip whole priority levels before the first task asked for.
+        if task_number + len(dictionary[key]) <= first:
+            task_number += len(dictionary[key])
+            continue
+        for an_entry in dictionary[key]:
+            if None != last and task_number > last:
+                return
+            if task_number >= first:
+                yield (task_number, an_entry)
             task_number += 1
-    # Return the string to be displayed.
-    return display_string[:-1]
 
+###################################
+# Purpose:
+#	Build the JSON object for a task, for tools that read the list rather
+#	than people.
+# Inputs:
+#	an_entry    -	The task
+#	task_number -	The number the task is displayed with
+#	completed   -	When the task was completed, if that isn't held by the
+#			task itself as with the done file.
+# Outputs:
+#	The JSON object for the task on a line of its own.
+###################################
+def task_record(an_entry, task_number, completed=None):
+    import json
+    if None == completed:
+        completed = an_entry.completed
+    return json.dumps({"number": task_number, "id": an_entry.id,\
+        "text": an_entry.line, "pri": an_entry.pri, "lev": an_entry.lev,\
+        "add": an_entry.add, "due": an_entry.due, "completed": completed,\
+        "subtasks": [{"text": subtask.task, "completed": subtask.completed}\
+            for subtask in an_entry.sub]}, sort_keys=True)+"\n"
+
+###################################
+# Purpose:
+#	Build the JSON objects for the tasks in the dictionary, one line each in
+#	the order they are numbered.
+# Inputs:
+#	dictionary  -	The dictionary that contains all the tasks.
+#	first	    -	The number of the first task
+#	last	    -	The number of the last task, None for all
+# Outputs:
+#	Generates the line for each task in turn.
+###################################
+def generate_json_lines(dictionary, first=1, last=None):
+    for (task_number, an_entry) in numbered_tasks(dictionary, first, last):
+        yield task_record(an_entry, task_number)
+
+###################################
+# Purpose:
+#	Print a display to stdout as it is generated. The strings are encoded
+#	and written in blocks so the whole display is never held in memory.
+# Inputs:
+#	display_strings -   The strings to display, each ending in a new line.
+#	blank	    -	Print an empty line if there is nothing to display.
+# Outputs:
+#	N/A
+###################################
+def write_display(display_strings, blank=True):
+    stream = sys.stdout
+    block = []
+    size = 0
+    written = False
+    for display_string in display_strings:
+        data = display_string.encode("utf-8")
+        block.append(data)
+        size += len(data)
+        if size >= WRITE_BUFFER:
+            stream.write("".join(block))
+            block = []
+            size = 0
+            written = True
+    if [] != block:
+        stream.write("".join(block))
+    elif not written and blank:
+        # An empty display is still a line, as print would give.
+        stream.write("\n")
+    stream.flush()
+
+###################################
+# Purpose:
+#	Build the string to display a single task with the given task number,
+#	used to remind the user which task they are changing.
+#
+# Inputs:
+#	an_entry    -	The task to display
+#	task_number -	The number to show for the task
+#
+# Outputs:
+#	The string representing the task for display
+###################################
+def display_task(an_entry, task_number):
+    return generate_output_string(build_priority_string(an_entry.pri,\
+        an_entry.lev), task_number, an_entry)[:-1]